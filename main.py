@@ -1,7 +1,7 @@
 # main.py (Simplified - Letting PTB manage loop)
 import logging
 import asyncio
-from telegram.ext import Application
+from telegram.ext import AIORateLimiter, Application
 from telegram import Update
 from telegram.ext import CommandHandler, ContextTypes
 import os
@@ -31,7 +31,13 @@ async def main_async_logic():
         return
 
     # --- Create Minimal Bot Application ---
-    application = Application.builder().token(BOT_TOKEN).build()
+    # AIORateLimiter queues requests under Telegram's global/per-chat limits and retries 429s
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .rate_limiter(AIORateLimiter(overall_max_rate=25, group_max_rate=20, max_retries=3))
+        .build()
+    )
 
     # --- Add ONLY a simple start handler ---
     application.add_handler(CommandHandler('start', simple_start))
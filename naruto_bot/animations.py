@@ -4,12 +4,23 @@ import logging
 from telegram.ext import ContextTypes
 from telegram.helpers import escape_markdown
 from .config import config
-from .game_data import ELEMENT_ANIMATIONS, JUTSU_LIBRARY, TRAINING_ANIMATIONS, MISSIONS
+from .game_data import ELEMENT_ANIMATIONS_BY_ID, JUTSU_LIBRARY, TRAINING_ANIMATIONS, MISSIONS
 from .services import get_hand_signs_for_jutsu, health_bar
 
 logger = logging.getLogger(__name__)
 ANIMATION_DELAY = config.ANIMATION_DELAY
 
+async def _play_frames(message, frames, delay: float):
+    """
+    Edits through frames, waking at fixed offsets from the first frame so slow
+    edits don't push every later frame further out.
+    """
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    for i, frame in enumerate(frames):
+        await message.edit_text(frame)
+        await asyncio.sleep(max(0.0, t0 + (i + 1) * delay - loop.time()))
+
 # --- Battle Animations (Prompts 5, 6, 12, 13) ---
 
 async def animate_hand_signs(message, jutsu_key: str):
@@ -19,12 +30,12 @@ async def animate_hand_signs(message, jutsu_key: str):
         return
         
     base_text = "🤲 Forming hand signs...\n"
+    frames = []
     current_signs = ""
     for sign in signs:
         current_signs += f"→ {sign.capitalize()} "
-        frame = base_text + current_signs
-        await message.edit_text(frame)
-        await asyncio.sleep(ANIMATION_DELAY)
+        frames.append(base_text + current_signs)
+    await _play_frames(message, frames, ANIMATION_DELAY)
 
 async def animate_chakra_charge(message):
     """Animates the chakra charging progress bar (Prompt 6)."""
@@ -36,9 +47,7 @@ async def animate_chakra_charge(message):
         "Chakra Gathering: [▰▰▰▰▰▰▰▱▱▱] 80%",
         "Chakra Gathering: [▰▰▰▰▰▰▰▰▰▰] 100% READY! 💫"
     ]
-    for frame in charge_frames:
-        await message.edit_text(frame)
-        await asyncio.sleep(ANIMATION_DELAY * 0.8) # Slightly faster
+    await _play_frames(message, charge_frames, ANIMATION_DELAY * 0.8) # Slightly faster
 
 async def animate_fireball(message):
     """Specific jutsu animation for Fireball (Prompt 6)."""
@@ -51,9 +60,7 @@ async def animate_fireball(message):
         "(🔥=======>) Flying!",
         "(🔥=========>) 💥 **DIRECT HIT!**"
     ]
-    for frame in fire_frames:
-        await message.edit_text(frame)
-        await asyncio.sleep(ANIMATION_DELAY)
+    await _play_frames(message, fire_frames, ANIMATION_DELAY)
 
 # Dictionary to map specific jutsu keys to their unique animation functions
 SPECIFIC_JUTSU_ANIMATIONS = {
@@ -71,13 +78,9 @@ async def animate_jutsu_effect(message, jutsu_key: str):
     if not jutsu:
         return
         
-    element = jutsu.get('element', 'none')
-    
     # 1. Play Element Animation (Prompt 12)
-    element_frames = ELEMENT_ANIMATIONS.get(element, ELEMENT_ANIMATIONS['none'])
-    for frame in element_frames:
-        await message.edit_text(frame)
-        await asyncio.sleep(ANIMATION_DELAY)
+    element_frames = ELEMENT_ANIMATIONS_BY_ID[jutsu['element_id']]
+    await _play_frames(message, element_frames, ANIMATION_DELAY)
         
     # 2. Play Specific Jutsu Animation (if it exists)
     specific_anim_func = SPECIFIC_JUTSU_ANIMATIONS.get(jutsu_key)
@@ -93,9 +96,7 @@ async def animate_critical_hit(message):
         "🎯 **WEAK POINT HIT!** 🎯",
         "✨ ✨ ✨"
     ]
-    for frame in crit_frames:
-        await message.edit_text(frame)
-        await asyncio.sleep(ANIMATION_DELAY * 0.7) # Faster
+    await _play_frames(message, crit_frames, ANIMATION_DELAY * 0.7) # Faster
 
 async def animate_damage_result(message, attacker_name, defender_name, damage, defender_hp, defender_max_hp):
     """Animates the damage result and updates health bar (Prompt 5)."""
@@ -104,9 +105,7 @@ async def animate_damage_result(message, attacker_name, defender_name, damage, d
         f"💥 {attacker_name} hits {defender_name} for **{damage}** damage!\n{defender_name} HP: {health_bar(defender_hp, defender_max_hp)}",
         f"💥 {attacker_name} hits {defender_name} for **{damage}** damage!\n{defender_name} HP: {health_bar(defender_hp, defender_max_hp)}",
     ]
-    for frame in damage_frames:
-        await message.edit_text(frame)
-        await asyncio.sleep(ANIMATION_DELAY)
+    await _play_frames(message, damage_frames, ANIMATION_DELAY)
 
 # --- Other Game Animations ---
 
@@ -125,9 +124,7 @@ async def animate_jutsu_discovery(message, player_name, new_jutsu_dict):
         "📚 This technique is now recorded in your scroll!"
     ]
     
-    for frame in discovery_frames:
-        await message.edit_text(frame)
-        await asyncio.sleep(ANIMATION_DELAY * 1.5)
+    await _play_frames(message, discovery_frames, ANIMATION_DELAY * 1.5)
 
 async def animate_activity(message, activity_type: str, activity_key: str):
     """
@@ -148,6 +145,4 @@ async def animate_activity(message, activity_type: str, activity_key: str):
     frames = activity_data['frames']
     duration_per_frame = activity_data['duration_sec'] / len(frames)
     
-    for frame in frames:
-        await message.edit_text(frame)
-        await asyncio.sleep(duration_per_frame)
+    await _play_frames(message, frames, duration_per_frame)
@@ -3,10 +3,15 @@ import random
 import logging
 import asyncio
 import json
+import zlib
 from datetime import datetime
+from functools import lru_cache
 from .models import Player
 from .config import config
-from .game_data import ELEMENT_MATRIX, JUTSU_LIBRARY, VILLAGES
+from .game_data import (
+    EFFECT_IDS, EFFECTS, ELEMENT_MATRIX_FLAT, ELEMENT_NAME, JUTSU_IDS, JUTSU_LIBRARY, NONE,
+    VILLAGE_ELEMENT_IDS, unpack_jutsu
+)
 from .services import get_jutsu_by_name, health_bar, chakra_bar, safe_animation
 from .animations import (
     animate_hand_signs, 
@@ -25,22 +30,23 @@ def calculate_damage(attacker: Player, defender: Player, jutsu_key: str) -> tupl
     Calculates the damage dealt by a jutsu.
     Returns: (final_damage, is_critical, is_elemental_bonus, effect_str)
     """
-    jutsu = JUTSU_LIBRARY.get(jutsu_key)
-    if not jutsu:
+    jid = JUTSU_IDS.get(jutsu_key)
+    if jid is None:
         logger.error(f"Invalid jutsu_key '{jutsu_key}' passed to calculate_damage")
         return 0, False, False, ""
+    power, _, _, atk_elem, effect_id, _ = unpack_jutsu(jid)
 
     # 1. Base Damage
-    base_damage = jutsu['power'] + (attacker.level * 2) + (attacker.intelligence * 1.5)
+    base_damage = power + (attacker.level * 2) + (attacker.intelligence * 1.5)
     
     # 2. Village Bonus
     attacker_village_bonus, bonus_percent = attacker.get_village_bonus()
-    if attacker_village_bonus == jutsu['element']:
+    if attacker_village_bonus == ELEMENT_NAME[atk_elem]:
         base_damage *= (1 + bonus_percent)
         
     # 3. Elemental Bonus
-    defender_element = VILLAGES.get(defender.village, {}).get('element_bonus', 'none')
-    element_bonus = ELEMENT_MATRIX[jutsu['element']][defender_element]
+    def_elem = VILLAGE_ELEMENT_IDS.get(defender.village, NONE)
+    element_bonus = ELEMENT_MATRIX_FLAT[atk_elem][def_elem]
     
     # 4. Critical Chance
     critical_chance = (attacker.speed / 500) + 0.05
@@ -56,15 +62,47 @@ def calculate_damage(attacker: Player, defender: Player, jutsu_key: str) -> tupl
     )
     
     # 7. Handle effects
-    effect_str = jutsu.get('effect')
-    if effect_str:
-        if effect_str == 'heal':
-            final_damage = -abs(jutsu['power'])
-        elif effect_str in ['evasion_up', 'defense_up', 'stun', 'accuracy_down']:
-            final_damage = 0
+    effect_str = EFFECTS[effect_id] if effect_id else None
+    if effect_id == _HEAL:
+        final_damage = -abs(power)
+    elif effect_id in _ZERO_DAMAGE_EFFECTS:
+        final_damage = 0
         
     return final_damage, is_critical, element_bonus > 1.2, effect_str
 
+# --- Battle Rewards ---
+
+@lru_cache(maxsize=None)
+def battle_rewards(winner_level: int, loser_level: int) -> tuple[int, int]:
+    """Returns (exp_gain, ryo_gain) for the winner; memoized per level pair."""
+    level_diff = max(0, loser_level - winner_level)
+    exp_gain = max(10, (loser_level * 10) + 25 + (level_diff * 5))
+    ryo_gain = max(20, (loser_level * 5) + 50 + (level_diff * 10))
+    return exp_gain, ryo_gain
+
+# --- Effect Dispatch ---
+
+_HEAL = EFFECT_IDS['heal']
+_ZERO_DAMAGE_EFFECTS = frozenset(EFFECT_IDS[e] for e in ('evasion_up', 'defense_up', 'stun', 'accuracy_down'))
+
+def _effect_heal(attacker_data: dict, defender_data: dict, jutsu: dict, damage: int) -> str:
+    heal_amount = abs(damage)
+    attacker_data['current_hp'] = min(attacker_data['max_hp'], attacker_data['current_hp'] + heal_amount)
+    return f"✨ {attacker_data['username']} heals for {heal_amount} HP!"
+
+def _effect_defense_up(attacker_data: dict, defender_data: dict, jutsu: dict, damage: int) -> str:
+    attacker_data['battle_effects']['defense_up'] = 3
+    return f"🛡️ {attacker_data['username']}'s defense increased!"
+
+def _effect_generic(attacker_data: dict, defender_data: dict, jutsu: dict, damage: int) -> str:
+    return f"🌀 {attacker_data['username']} used {jutsu['name']}!"
+
+# Indexed by effect_id; effects without special handling just announce the jutsu
+EFFECT_HANDLERS = tuple(
+    {'heal': _effect_heal, 'defense_up': _effect_defense_up}.get(effect, _effect_generic)
+    for effect in EFFECTS
+)
+
 # --- Battle State Manager ---
 
 class Battle:
@@ -85,6 +123,9 @@ class Battle:
         self.battle_message_id = None
         self.chat_id = None
         self.last_action_time = datetime.now()
+        self.log_saved = 0 # How many log entries are already in the cache
+        self.last_text_hash = None # Fingerprint of what the battle message shows (see render_changed)
+        self._build_labels()
 
     def _serialize_player(self, player: Player) -> dict:
         """Stores a snapshot of player data for battle."""
@@ -104,6 +145,60 @@ class Battle:
             'battle_effects': {}
         }
 
+    def to_dict(self) -> dict:
+        """Plain-data snapshot for the cache (see Battle.from_dict)."""
+        return {
+            'battle_id': self.battle_id,
+            'player1_id': self.player1_id,
+            'player2_id': self.player2_id,
+            'turn': self.turn,
+            'log': self.log,
+            'turn_count': self.turn_count,
+            'players': self.players,
+            'battle_message_id': self.battle_message_id,
+            'chat_id': self.chat_id,
+            'last_action_time': self.last_action_time.timestamp(),
+            'last_text_hash': self.last_text_hash
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Battle':
+        """Rebuilds a Battle from to_dict() output without re-reading the players."""
+        battle = cls.__new__(cls)
+        battle.battle_id = data['battle_id']
+        battle.player1_id = data['player1_id']
+        battle.player2_id = data['player2_id']
+        battle.turn = data['turn']
+        battle.log = data['log']
+        battle.turn_count = data['turn_count']
+        battle.players = data['players']
+        battle.battle_message_id = data['battle_message_id']
+        battle.chat_id = data['chat_id']
+        battle.last_action_time = datetime.fromtimestamp(data['last_action_time'])
+        battle.log_saved = len(battle.log)
+        battle.last_text_hash = data.get('last_text_hash')
+        battle._build_labels()
+        return battle
+
+    def render_changed(self, text: str, with_keyboard: bool = False) -> bool:
+        """
+        Records `text` as what the battle message now shows. Returns False if it is what the
+        message already shows, so the edit can be skipped ("message is not modified").
+        Uses crc32 rather than hash() so the fingerprint stays valid across restarts.
+        """
+        fingerprint = zlib.crc32(text.encode()) << 1 | with_keyboard
+        if fingerprint == self.last_text_hash:
+            return False
+        self.last_text_hash = fingerprint
+        return True
+
+    def _build_labels(self):
+        """Precomputes the per-player lines of the battle screen that never change mid-battle."""
+        self._labels = {
+            user_id: f"{data['username']} [Lvl {data['level']}]\n"
+            for user_id, data in self.players.items()
+        }
+
     def get_player_data(self, user_id: int) -> dict:
         return self.players[user_id]
 
@@ -134,10 +229,10 @@ class Battle:
         
         return (
             f"⚔️ **BATTLE! (Turn {self.turn_count})** ⚔️\n\n"
-            f"{p1_turn} {p1['username']} [Lvl {p1['level']}]\n"
+            f"{p1_turn} {self._labels[self.player1_id]}"
             f"❤️ {health_bar(p1['current_hp'], p1['max_hp'])}\n"
             f"🔵 {chakra_bar(p1['current_chakra'], p1['max_chakra'])}\n\n"
-            f"{p2_turn} {p2['username']} [Lvl {p2['level']}]\n"
+            f"{p2_turn} {self._labels[self.player2_id]}"
             f"❤️ {health_bar(p2['current_hp'], p2['max_hp'])}\n"
             f"🔵 {chakra_bar(p2['current_chakra'], p2['max_chakra'])}"
         )
@@ -173,10 +268,6 @@ async def battle_animation_flow(message_editor, attacker: Player, defender: Play
             self.speed = data['speed']
             self.stamina = data['stamina']
             self.village = data['village']
-        
-        def get_village_bonus(self):
-            village_data = VILLAGES.get(self.village, {})
-            return village_data.get('element_bonus', 'none'), village_data.get('bonus_percent', 0)
     
     temp_attacker = TempPlayer(attacker_data)
     temp_defender = TempPlayer(defender_data)
@@ -187,15 +278,7 @@ async def battle_animation_flow(message_editor, attacker: Player, defender: Play
     final_message = ""
     if effect:
         # Handle special effects
-        if effect == 'heal':
-            heal_amount = abs(damage)
-            attacker_data['current_hp'] = min(attacker_data['max_hp'], attacker_data['current_hp'] + heal_amount)
-            final_message = f"✨ {attacker_data['username']} heals for {heal_amount} HP!"
-        elif effect == 'defense_up':
-            attacker_data['battle_effects']['defense_up'] = 3
-            final_message = f"🛡️ {attacker_data['username']}'s defense increased!"
-        else:
-            final_message = f"🌀 {attacker_data['username']} used {jutsu['name']}!"
+        final_message = EFFECT_HANDLERS[jutsu['effect_id']](attacker_data, defender_data, jutsu, damage)
     else:
         # Handle damage
         if is_crit:
@@ -1,6 +1,7 @@
 # naruto_bot/cache.py
 import redis.asyncio as redis
 import pickle
+import msgpack
 import logging
 import asyncio
 from .config import config
@@ -80,6 +81,30 @@ class CacheManager:
         except Exception as e:
             logger.error(f"Failed to delete cache for key {full_key}: {e}")
 
+    async def set_many(self, items: list[tuple[str, str, any]], ttl: int = None):
+        """Caches several (prefix, key, value) entries in one pipelined round trip."""
+        if not items:
+            return
+        client = await self._get_client()
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                for prefix, key, value in items:
+                    pipe.set(self._get_key(prefix, str(key)), pickle.dumps(value), ex=ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to set {len(items)} cache entries: {e}")
+
+    async def delete_many(self, items: list[tuple[str, str]]):
+        """Deletes several (prefix, key) entries with a single DEL."""
+        if not items:
+            return
+        client = await self._get_client()
+        full_keys = [self._get_key(prefix, str(key)) for prefix, key in items]
+        try:
+            await client.delete(*full_keys)
+        except Exception as e:
+            logger.error(f"Failed to delete cache keys {full_keys}: {e}")
+
     async def close(self):
         """Closes the Redis connection pool."""
         if self.redis_client:
@@ -101,6 +126,60 @@ class CacheManager:
         """Gets the ID of the user's opponent."""
         return await self.get_data("battle_lock", str(user_id))
 
+    async def save_battle_state(self, battle_id: str, fields: dict, new_log_entries: list[str], ttl: int,
+                                max_log: int | None = None):
+        """
+        Writes battle state as a hash of msgpack-encoded fields plus an append-only log list,
+        so a turn only sends the fields that changed and its new log lines. One round trip.
+        If max_log is set, only the newest max_log log lines are kept.
+        """
+        client = await self._get_client()
+        state_key = self._get_key("battle_state", battle_id)
+        log_key = self._get_key("battle_log", battle_id)
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                if fields:
+                    pipe.hset(state_key, mapping={f: msgpack.packb(v, use_bin_type=True) for f, v in fields.items()})
+                if new_log_entries:
+                    pipe.rpush(log_key, *new_log_entries)
+                    if max_log:
+                        pipe.ltrim(log_key, -max_log, -1)
+                pipe.expire(state_key, ttl)
+                pipe.expire(log_key, ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to save battle state {state_key}: {e}")
+
+    async def get_battle_field(self, battle_id: str, field: str) -> any:
+        """Reads a single field of a saved battle (e.g. 'turn') without loading the rest."""
+        client = await self._get_client()
+        state_key = self._get_key("battle_state", battle_id)
+        try:
+            value = await client.hget(state_key, field)
+            if value is not None:
+                return msgpack.unpackb(value, raw=False, strict_map_key=False)
+        except Exception as e:
+            logger.error(f"Failed to read field '{field}' of battle state {state_key}: {e}")
+        return None
+
+    async def load_battle_state(self, battle_id: str) -> dict | None:
+        """Reads back a battle saved with save_battle_state, with the full log under 'log'."""
+        client = await self._get_client()
+        state_key = self._get_key("battle_state", battle_id)
+        log_key = self._get_key("battle_log", battle_id)
+        try:
+            async with client.pipeline(transaction=False) as pipe:
+                pipe.hgetall(state_key)
+                pipe.lrange(log_key, 0, -1)
+                fields, log = await pipe.execute()
+            if fields:
+                state = {f.decode(): msgpack.unpackb(v, raw=False, strict_map_key=False) for f, v in fields.items()}
+                state['log'] = [entry.decode() for entry in log]
+                return state
+        except Exception as e:
+            logger.error(f"Failed to load battle state {state_key}: {e}")
+        return None
+
 # --- Global Instance ---
 cache_manager = CacheManager()
 
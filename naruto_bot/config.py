@@ -36,8 +36,13 @@ class Config:
     MAX_CONCURRENT_BATTLES = int(os.getenv('MAX_CONCURRENT_BATTLES', 15))
     BATTLE_TIMEOUT_SECONDS = int(os.getenv('BATTLE_TIMEOUT_SECONDS', 300))
     ANIMATION_DELAY = float(os.getenv('ANIMATION_DELAY', 0.8))
+    MAX_CONCURRENT_ANIMATIONS = int(os.getenv('MAX_CONCURRENT_ANIMATIONS', 20))
+    EDIT_MIN_INTERVAL = float(os.getenv('EDIT_MIN_INTERVAL', 1.0)) # Telegram: ~1 edit/s per message
     PLAYER_CACHE_TTL = int(os.getenv('PLAYER_CACHE_TTL', 1800))
+    LOCAL_PLAYER_CACHE_TTL = int(os.getenv('LOCAL_PLAYER_CACHE_TTL', 60))
+    LOCAL_PLAYER_CACHE_SIZE = int(os.getenv('LOCAL_PLAYER_CACHE_SIZE', 10000))
     BATTLE_CACHE_TTL = int(os.getenv('BATTLE_CACHE_TTL', 3600))
+    BATTLE_LOG_MAXLEN = int(os.getenv('BATTLE_LOG_MAXLEN', 64)) # Log lines kept per battle
     CLEANUP_INTERVAL = int(os.getenv('CLEANUP_INTERVAL', 1800))
     DATABASE_BACKUP_HOURS = int(os.getenv('DATABASE_BACKUP_HOURS', 24))
 
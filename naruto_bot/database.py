@@ -1,6 +1,8 @@
 import sqlite3
 import logging
 import os
+import threading
+from contextlib import contextmanager
 from .config import config
 
 logger = logging.getLogger(__name__)
@@ -32,6 +34,8 @@ DB_SCHEMA = [
         wins INTEGER DEFAULT 0,
         losses INTEGER DEFAULT 0,
         current_mission TEXT,
+        current_activity_kind TEXT,
+        current_activity_key TEXT,
         battle_cooldown TEXT,
         last_regen TEXT,
         created_at TEXT DEFAULT CURRENT_TIMESTAMP
@@ -59,16 +63,46 @@ DB_SCHEMA = [
     """
 ]
 
+# Columns added after the initial schema: (table, column, definition).
+# CREATE TABLE IF NOT EXISTS leaves existing tables alone, so these are added explicitly.
+DB_ADDED_COLUMNS = [
+    ('players', 'current_activity_kind', 'TEXT'),
+    ('players', 'current_activity_key', 'TEXT'),
+]
+
 def get_db_connection() -> sqlite3.Connection:
     """Establishes a connection to the SQLite database."""
     try:
         conn = sqlite3.connect(config.DATABASE_PATH)
         conn.row_factory = sqlite3.Row
+        # Per-connection settings; journal_mode=WAL is set once in init_database
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
         return conn
     except sqlite3.Error as e:
         logger.critical(f"Failed to connect to database at {config.DATABASE_PATH}: {e}")
         raise
 
+# One long-lived connection for small background writes, shared across executor threads
+_write_conn: sqlite3.Connection | None = None
+_write_lock = threading.Lock()
+
+@contextmanager
+def write_connection():
+    """
+    Yields the shared writer connection, serialized by a lock.
+    Commits on success and rolls back on error, like `with conn:`.
+    """
+    global _write_conn
+    with _write_lock:
+        if _write_conn is None:
+            _write_conn = sqlite3.connect(config.DATABASE_PATH, check_same_thread=False)
+            _write_conn.row_factory = sqlite3.Row
+            _write_conn.execute("PRAGMA synchronous=NORMAL") # Safe with WAL; fewer fsyncs
+            _write_conn.execute("PRAGMA temp_store=MEMORY")
+        with _write_conn:
+            yield _write_conn
+
 def init_database():
     """
     Initializes the database and creates tables based on the schema.
@@ -79,8 +113,15 @@ def init_database():
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            # WAL lets readers proceed during writes; the setting persists in the file
+            cursor.execute("PRAGMA journal_mode=WAL")
             for table_sql in DB_SCHEMA:
                 cursor.execute(table_sql)
+            for table, column, definition in DB_ADDED_COLUMNS:
+                existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                    logger.info(f"Added column {table}.{column}.")
             conn.commit()
             logger.info("Database tables verified and created successfully.")
     except sqlite3.Error as e:
@@ -1,4 +1,11 @@
 # naruto_bot/game_data.py
+import logging
+import struct
+import sys
+from enum import IntEnum
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
 
 # Prompt 3: Villages
 VILLAGES = {
@@ -74,6 +81,7 @@ ELEMENT_MATRIX = {
 
 # Prompt 9: Jutsu System
 HAND_SIGNS = ['tiger', 'snake', 'dog', 'bird', 'ram', 'boar', 'hare', 'rat', 'monkey', 'dragon']
+HAND_SIGNS_SET = frozenset(HAND_SIGNS)  # for membership tests; HAND_SIGNS keeps display order
 
 # Jutsu Library (keeping your existing jutsus - no changes needed)
 JUTSU_LIBRARY = {
@@ -386,3 +394,156 @@ TRAINING_ANIMATIONS = {
         ]
     }
 }
+
+# --- Derived Lookup Tables (built once at import) ---
+
+ELEMENTS = ('fire', 'water', 'wind', 'earth', 'lightning', 'none')
+ELEMENT_IDS = {element: i for i, element in enumerate(ELEMENTS)}
+SIGN_IDS = {sign: i for i, sign in enumerate(HAND_SIGNS)}
+
+# Integer enums generated from the name tables
+Element = IntEnum('Element', {element.upper(): i for i, element in enumerate(ELEMENTS)})
+HandSign = IntEnum('HandSign', {sign.upper(): i for i, sign in enumerate(HAND_SIGNS)})
+
+# Bare int aliases for hot paths
+FIRE = int(Element.FIRE)
+WATER = int(Element.WATER)
+WIND = int(Element.WIND)
+EARTH = int(Element.EARTH)
+LIGHTNING = int(Element.LIGHTNING)
+NONE = int(Element.NONE)
+
+TIGER = int(HandSign.TIGER)
+SNAKE = int(HandSign.SNAKE)
+DOG = int(HandSign.DOG)
+BIRD = int(HandSign.BIRD)
+RAM = int(HandSign.RAM)
+BOAR = int(HandSign.BOAR)
+HARE = int(HandSign.HARE)
+RAT = int(HandSign.RAT)
+MONKEY = int(HandSign.MONKEY)
+DRAGON = int(HandSign.DRAGON)
+
+# id -> name compatibility helpers
+ELEMENT_NAME = ELEMENTS
+SIGN_NAME = tuple(HAND_SIGNS)
+
+# ELEMENT_MATRIX flattened to nested tuples indexed by element id
+ELEMENT_MATRIX_FLAT = tuple(
+    tuple(ELEMENT_MATRIX[atk][dfn] for dfn in ELEMENTS) for atk in ELEMENTS
+)
+
+# village -> element id of its affinity (defender side of the element matrix)
+VILLAGE_ELEMENT_IDS = {village: ELEMENT_IDS[v['element_bonus']] for village, v in VILLAGES.items()}
+
+# Element animation frames indexed by element id
+ELEMENT_ANIMATIONS_BY_ID = tuple(
+    tuple(sys.intern(frame) for frame in ELEMENT_ANIMATIONS[element]) for element in ELEMENTS
+)
+
+# Integer element id on every jutsu so the battle pipeline never re-resolves the name
+for _jutsu in JUTSU_LIBRARY.values():
+    _jutsu['element_id'] = ELEMENT_IDS[_jutsu['element']]
+
+# Jutsu sign sequences as interned tuples; identical sequences share one object
+_SIGN_POOL = {}
+for _jutsu in JUTSU_LIBRARY.values():
+    _signs = tuple(sys.intern(sign) for sign in _jutsu['signs'])
+    _jutsu['signs'] = _SIGN_POOL.setdefault(_signs, _signs)
+
+# Hand-sign trie: nested dicts keyed by sign name, the jutsu key stored under None.
+# The first jutsu in JUTSU_LIBRARY order wins when two share a sequence.
+SIGN_TRIE = {}
+for _key, _jutsu in JUTSU_LIBRARY.items():
+    _node = SIGN_TRIE
+    for _sign in _jutsu['signs']:
+        _node = _node.setdefault(_sign, {})
+    _node.setdefault(None, _key)
+
+def _walk_sign_trie(signs) -> dict | None:
+    node = SIGN_TRIE
+    for sign in signs:
+        node = node.get(sign)
+        if node is None:
+            return None
+    return node
+
+def match_signs(signs) -> str | None:
+    """Returns the jutsu key formed by exactly this sign sequence, or None."""
+    node = _walk_sign_trie(signs)
+    return node.get(None) if node else None
+
+def prefix_possible(signs) -> bool:
+    """Checks whether some jutsu's sign sequence starts with these signs."""
+    return _walk_sign_trie(signs) is not None
+
+# Jutsu effect tags and their integer ids (0 = no effect)
+EFFECTS = ('none', 'evasion_up', 'stun', 'defense_up', 'dodge', 'distract', 'heal', 'accuracy_down')
+EFFECT_IDS = {effect: i for i, effect in enumerate(EFFECTS)}
+for _jutsu in JUTSU_LIBRARY.values():
+    _jutsu['effect_id'] = EFFECT_IDS[_jutsu.get('effect', 'none')]
+
+# Compact jutsu records: 16 bytes per jutsu, indexed by JUTSU_IDS[key]
+# (power, chakra_cost, level_required, element_id, effect_id, signs_packed)
+# signs_packed holds one sign per 4 bits as sign_id + 1, lowest nibble first, 0 terminated.
+JUTSU_KEYS = tuple(JUTSU_LIBRARY)
+JUTSU_IDS = {key: i for i, key in enumerate(JUTSU_KEYS)}
+_JUTSU_RECORD = struct.Struct('<HHHBBQ')
+
+def _pack_signs(signs) -> int:
+    packed = 0
+    for i, sign in enumerate(signs):
+        packed |= (SIGN_IDS[sign] + 1) << (4 * i)
+    return packed
+
+JUTSU_BLOB = bytearray(_JUTSU_RECORD.size * len(JUTSU_KEYS))
+for _jid, _key in enumerate(JUTSU_KEYS):
+    _jutsu = JUTSU_LIBRARY[_key]
+    _JUTSU_RECORD.pack_into(
+        JUTSU_BLOB, _jid * _JUTSU_RECORD.size,
+        _jutsu['power'], _jutsu['chakra_cost'], _jutsu['level_required'],
+        _jutsu['element_id'], _jutsu['effect_id'], _pack_signs(_jutsu['signs'])
+    )
+JUTSU_BLOB = bytes(JUTSU_BLOB)
+
+def unpack_jutsu(jid: int) -> tuple[int, int, int, int, int, int]:
+    """Returns (power, chakra_cost, level_required, element_id, effect_id, signs_packed) for a jutsu id."""
+    return _JUTSU_RECORD.unpack_from(JUTSU_BLOB, jid * _JUTSU_RECORD.size)
+
+def unpack_signs(signs_packed: int) -> tuple[str, ...]:
+    """Decodes a packed sign sequence back into sign names."""
+    signs = []
+    while signs_packed:
+        signs.append(SIGN_NAME[(signs_packed & 0xF) - 1])
+        signs_packed >>= 4
+    return tuple(signs)
+
+# Jutsus that can be used in battle: anything that deals damage or has an effect
+BATTLE_JUTSU_KEYS = frozenset(
+    key for key, jutsu in JUTSU_LIBRARY.items() if jutsu.get('power', 0) > 0 or 'effect' in jutsu
+)
+
+# Lower-cased jutsu names and keys -> key; keys win if a name ever collides with one
+JUTSU_NAME_INDEX = {jutsu['name'].lower(): key for key, jutsu in JUTSU_LIBRARY.items()}
+JUTSU_NAME_INDEX.update({key.lower(): key for key in JUTSU_LIBRARY})
+
+# Activity tables: validated once here so handlers can index them without re-checking
+MISSION_REQUIRED_KEYS = ('name', 'exp', 'ryo', 'level_req', 'duration_sec', 'animation_frames')
+TRAINING_REQUIRED_KEYS = ('duration_sec', 'frames', 'stat', 'gain', 'display_name', 'description')
+
+def _validated(table: dict, required: tuple, frames_key: str, label: str, check=None) -> MappingProxyType:
+    """Returns a read-only view of `table` without entries that are incomplete, frameless or fail `check`."""
+    valid = {}
+    for key, details in table.items():
+        if (not isinstance(details, dict) or not all(k in details for k in required)
+                or not details[frames_key] or (check and not check(details))):
+            logger.warning(f"{label} definition '{key}' is incomplete or invalid. Skipping.")
+            continue
+        valid[key] = details
+    return MappingProxyType(valid)
+
+MISSIONS = _validated(MISSIONS, MISSION_REQUIRED_KEYS, 'animation_frames', 'Mission')
+TRAINING_ANIMATIONS = _validated(
+    TRAINING_ANIMATIONS, TRAINING_REQUIRED_KEYS, 'frames', 'Training',
+    check=lambda t: isinstance(t['gain'], (int, float)) and t['gain'] > 0
+)
@@ -1,26 +1,110 @@
 # naruto_bot/handlers/activity_handlers.py
 import logging
 import asyncio
+import itertools
+import re
+from functools import wraps
+from bisect import bisect_right
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
-from telegram.constants import ParseMode
-from ..models import get_player
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import BadRequest, TelegramError
+from ..models import Player, get_player_cached, peek_player, player_writer
 from ..game_data import MISSIONS, TRAINING_ANIMATIONS
 from ..config import config
+from ..services import note_message_text, throttled_edit
 
 logger = logging.getLogger(__name__)
 
+_MD = ParseMode.MARKDOWN
+
+# Suffix for job names; the job store is in-memory, so per-process uniqueness is enough
+_JOB_SEQ = itertools.count()
+
+# user_id -> name of the completion job that owns the user's current mission/training.
+# Claimed atomically at start (no await between check and set) and released when the job ends.
+_ACTIVE_JOBS: dict[int, str] = {}
+
+def _claim_activity(user_id: int, job_name: str) -> bool:
+    return _ACTIVE_JOBS.setdefault(user_id, job_name) == job_name
+
+def _release_activity(user_id: int, job_name: str):
+    if _ACTIVE_JOBS.get(user_id) == job_name:
+        del _ACTIVE_JOBS[user_id]
+
+def _abandon_activity(user_id: int, job_name: str, kind: str, key: str):
+    """Frees a user whose completion job failed unexpectedly, so they aren't left busy."""
+    _release_activity(user_id, job_name)
+    player = peek_player(user_id)
+    if player and player.is_doing(kind, key):
+        player.clear_activity()
+        player_writer.enqueue(player)
+
+# --- Player Injection ---
+
+def with_player(handler):
+    """Calls handler(update, context, player) with the user's player from the in-process cache."""
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        player = await get_player_cached(user.id) if user else None
+        return await handler(update, context, player)
+    return wrapper
+
+# --- Precomputed Mission Boards ---
+
+_MISSION_START_PREFIX = 'mission_start_'
+# Matches every callback the mission board emits; 'rank' is None for locked buttons
+_MISSION_CALLBACK_RE = re.compile(rf'^(?:mission_locked|{re.escape(_MISSION_START_PREFIX)}(?P<rank>.+))$')
+
+def _build_mission_boards() -> tuple[list[int], list[tuple[Optional[InlineKeyboardMarkup], bool]]]:
+    """
+    Pre-renders one mission board per level bracket (MISSIONS is validated in game_data).
+    Returns (sorted level thresholds, boards); index boards with bisect_right(thresholds, level).
+    Each board is (reply_markup or None if no missions, any_mission_available).
+    """
+    valid_missions = list(MISSIONS.items())
+
+    levels = sorted({details['level_req'] for _, details in valid_missions})
+    boards = []
+    for bracket in range(len(levels) + 1):
+        unlocked_levels = levels[:bracket]
+        keyboard = []
+        for rank, details in valid_missions:
+            if details['level_req'] in unlocked_levels:
+                keyboard.append([
+                    InlineKeyboardButton(
+                        f"{rank}: {details['name']} ({details['exp']} EXP, {details['ryo']} Ryo)",
+                        callback_data=f"{_MISSION_START_PREFIX}{rank}"
+                    )
+                ])
+            else:
+                keyboard.append([
+                    InlineKeyboardButton(
+                        f"🔒 {rank}: {details['name']} (Lvl {details['level_req']} Req)",
+                        callback_data="mission_locked"
+                    )
+                ])
+        reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
+        boards.append((reply_markup, bracket > 0))
+    return levels, boards
+
+_MISSION_BOARD_LEVELS, _MISSION_BOARDS = _build_mission_boards()
+# A stored board is edited in place only if it is at most this many messages back in the chat
+_BOARD_REUSE_WINDOW = 5
+
 # --- Mission Handlers ---
 
-async def missions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@with_player
+async def missions_command(update: Update, context: ContextTypes.DEFAULT_TYPE, player: Optional[Player]):
     """Displays available missions."""
     user_id = update.effective_user.id
     if not user_id: 
         return
     logger.debug(f"Received /missions command from {user_id}")
     
-    player = await get_player(user_id)
     if not player:
         await update.message.reply_text("You must /start your journey first.")
         return
@@ -29,53 +113,42 @@ async def missions_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"You are already busy: {player.current_mission}")
         return
 
-    keyboard = []
-    logger.debug("Building mission keyboard...")
-    found_available = False
-    for rank, details in MISSIONS.items():
-        if not isinstance(details, dict) or not all(k in details for k in ['name', 'exp', 'ryo', 'level_req', 'duration_sec', 'animation_frames']):
-             logger.warning(f"Mission definition for rank '{rank}' is incomplete or invalid. Skipping.")
-             continue
-
-        if player.level >= details['level_req']:
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{rank}: {details['name']} ({details['exp']} EXP, {details['ryo']} Ryo)",
-                    callback_data=f"mission_start_{rank}"
-                )
-            ])
-            found_available = True
-        else:
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"🔒 {rank}: {details['name']} (Lvl {details['level_req']} Req)",
-                    callback_data="mission_locked"
-                )
-            ])
-
-    if not found_available and not keyboard:
+    reply_markup, found_available = _MISSION_BOARDS[bisect_right(_MISSION_BOARD_LEVELS, player.level)]
+
+    if reply_markup is None:
          await update.message.reply_text("There are currently no missions defined.")
          return
     elif not found_available:
-         reply_markup = InlineKeyboardMarkup(keyboard)
-         await update.message.reply_text(
-             "**Mission Board**\n\nKeep training to unlock these missions!",
-             reply_markup=reply_markup,
-             parse_mode=ParseMode.MARKDOWN
+         board_text = "**Mission Board**\n\nKeep training to unlock these missions!"
+    else:
+         board_text = (
+             "**Mission Board**\n\n"
+             "Select a mission to begin. You cannot battle or train while on a mission."
          )
-         return
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text(
-        "**Mission Board**\n\n"
-        "Select a mission to begin. You cannot battle or train while on a mission.",
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.MARKDOWN
-    )
+    # Reuse this user's previous board when it is still among the latest messages of the chat;
+    # otherwise (or if the edit changes nothing) send a fresh one so the command visibly answers
+    stash = context.user_data if context.user_data is not None else {}
+    chat_id = update.effective_chat.id
+    board = stash.get('mission_board')
+    if board and board[0] == chat_id and update.message.message_id - board[1] <= _BOARD_REUSE_WINDOW:
+        try:
+            await context.bot.edit_message_text(
+                chat_id=chat_id, message_id=board[1], text=board_text,
+                reply_markup=reply_markup, parse_mode=_MD
+            )
+            logger.debug(f"Mission board updated in place for {user_id}")
+            return
+        except BadRequest as e:
+            logger.debug(f"Could not reuse mission board for {user_id} ({e}); sending a new one.")
+
+    message = await update.message.reply_text(board_text, reply_markup=reply_markup, parse_mode=_MD)
+    stash['mission_board'] = (message.chat_id, message.message_id)
     logger.debug(f"Mission board sent to {user_id}")
 
 
-async def mission_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+@with_player
+async def mission_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, player: Optional[Player]):
     """Handles starting a mission from the callback."""
     query = update.callback_query
     user_id = update.effective_user.id
@@ -84,56 +157,56 @@ async def mission_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug(f"Received mission callback from {user_id}: {query.data}")
     await query.answer()
 
-    if query.data == "mission_locked":
+    mission_rank = context.matches[0].group('rank')
+    if mission_rank is None:
         await context.bot.send_message(user_id, "You do not meet the level requirement for this mission.")
         return
 
-    try:
-        mission_rank = query.data.split('_')[-1]
-    except IndexError:
-        logger.warning(f"Could not parse mission rank from callback data: {query.data}")
-        await query.edit_message_text("Error processing mission selection.")
-        return
-
     mission = MISSIONS.get(mission_rank)
-    if not mission or not isinstance(mission, dict):
+    if not mission:
         logger.warning(f"Invalid or non-existent mission rank '{mission_rank}' received from {user_id}.")
         await query.edit_message_text("Invalid mission selected.")
         return
 
-    player = await get_player(user_id)
     if not player:
         await query.edit_message_text("Player data not found. Please /start again.")
         return
 
-    if player.level < mission.get('level_req', 999):
+    if player.level < mission['level_req']:
          await context.bot.send_message(user_id, "You no longer meet the level requirement for this mission.")
          return
 
-    if player.current_mission:
-        await query.edit_message_text(f"You are already busy: {player.current_mission}")
+    job_name = f"mission_{user_id}_{mission_rank}_{next(_JOB_SEQ)}"
+    if player.current_mission or not _claim_activity(user_id, job_name):
+        await query.edit_message_text(f"You are already busy: {player.current_mission or 'starting another activity'}")
         return
 
-    if not all(k in mission for k in ['duration_sec', 'animation_frames', 'name', 'exp', 'ryo']) or not mission['animation_frames']:
-         logger.error(f"Mission '{mission_rank}' definition is incomplete. Cannot start.")
-         await query.edit_message_text("This mission is currently unavailable due to a configuration error.")
-         return
-
-    run_at = datetime.now(timezone.utc) + timedelta(seconds=mission['duration_sec'])
+    run_in = mission['duration_sec'] # Relative delay; JobQueue resolves it against its own clock
     start_frame = mission['animation_frames'][0]
     
     try:
-        message = await query.edit_message_text(start_frame, parse_mode=ParseMode.MARKDOWN)
+        message = await query.edit_message_text(start_frame, parse_mode=_MD)
+        note_message_text(message.chat_id, message.message_id, start_frame)
+        if context.user_data is not None:
+            context.user_data.pop('mission_board', None) # The board message now shows the mission
 
         if not context.job_queue:
             logger.error("JobQueue is not available in context. Cannot schedule mission completion.")
             await message.edit_text("Error: Cannot schedule mission completion. Please contact admin.")
+            _release_activity(user_id, job_name)
+            return
+
+        # Persist the activity before scheduling, so a job never runs for an unsaved mission
+        player.start_activity('mission', mission_rank, mission['name'])
+        if not await player.asave():
+            logger.error(f"Could not save mission '{mission_rank}' start for player {user_id}. Not scheduled.")
+            _abandon_activity(user_id, job_name, 'mission', mission_rank)
+            await message.edit_text("Failed to start the mission: your progress couldn't be saved. Please try again.")
             return
 
-        job_name = f"mission_{user_id}_{mission_rank}_{int(datetime.now().timestamp())}"
         context.job_queue.run_once(
             _mission_completion_job,
-            run_at,
+            run_in,
             data={
                 'user_id': player.user_id,
                 'chat_id': query.message.chat_id,
@@ -142,22 +215,127 @@ async def mission_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             },
             name=job_name
         )
-        logger.info(f"Scheduled mission '{mission_rank}' ({job_name}) for player {user_id} to complete at {run_at}.")
-
-        player.current_mission = mission['name']
-        player.mark_modified()
-        player.save()
+        logger.info(f"Scheduled mission '{mission_rank}' ({job_name}) for player {user_id} to complete in {run_in}s.")
 
     except Exception as e:
         logger.error(f"Failed to start mission '{mission_rank}' for player {user_id}: {e}", exc_info=True)
+        _abandon_activity(user_id, job_name, 'mission', mission_rank)
         try:
              await query.message.reply_text("Failed to start the mission due to an error.")
-        except Exception as report_err:
+        except (TelegramError, asyncio.TimeoutError) as report_err:
              logger.error(f"Failed also to send error report to user {user_id}: {report_err}")
 
 
+# --- Job-Queue Driven Animations ---
+
+# Caps how many completion jobs / frame edits talk to Telegram at once
+_ANIM_SEM = asyncio.Semaphore(config.MAX_CONCURRENT_ANIMATIONS)
+# Strong references so running tasks aren't garbage-collected mid-flight
+_background_tasks: set = set()
+
+def _log_exc(task: asyncio.Task):
+    """Done-callback that logs exceptions from detached completion tasks."""
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background activity task failed: {task.exception()}", exc_info=task.exception())
+
+async def _throttled(coro):
+    async with _ANIM_SEM:
+        await coro
+
+def _spawn(coro):
+    """Runs `coro` detached (and throttled) so the scheduler callback can return immediately."""
+    task = asyncio.create_task(_throttled(coro))
+    _background_tasks.add(task)
+    task.add_done_callback(_log_exc)
+
+def _fit_frames(frames, total_anim_duration: float) -> tuple[tuple, float]:
+    """
+    Downsamples `frames` so that, at no less than one frame per ANIMATION_DELAY (and never
+    faster than Telegram's per-message edit limit), they fit in `total_anim_duration`.
+    Keeps the first and last frames. Returns (frames, duration_per_frame).
+    """
+    min_delay = max(config.ANIMATION_DELAY, config.EDIT_MIN_INTERVAL)
+    if min_delay <= 0:
+        return tuple(frames), total_anim_duration / max(1, len(frames)) # No pacing limit: keep every frame
+    max_frames = max(1, int(total_anim_duration / min_delay))
+    n = len(frames)
+    if n > max_frames:
+        if max_frames == 1:
+            frames = (frames[-1],)
+        else:
+            frames = tuple(frames[round(i * (n - 1) / (max_frames - 1))] for i in range(max_frames))
+    return tuple(frames), max(min_delay, total_anim_duration / max(1, len(frames)))
+
+def _mission_schedule(mission: dict) -> tuple[tuple, float]:
+    # Frame 0 is shown at mission start; the final frame goes out with the reward summary
+    frames = mission['animation_frames']
+    frames, duration_per_frame = _fit_frames(frames[1:] if len(frames) > 1 else frames,
+                                             max(5.0, mission['duration_sec'] * 0.2))
+    return frames[:-1], duration_per_frame
+
+# Completion schedules are a pure function of the static tables + config: (frames, duration_per_frame)
+_MISSION_SCHEDULES = {rank: _mission_schedule(m) for rank, m in MISSIONS.items()}
+_TRAINING_SCHEDULES = {key: _fit_frames(t['frames'], max(3.0, t['duration_sec'] * 0.15))
+                       for key, t in TRAINING_ANIMATIONS.items()}
+
+def _schedule_animation(context: ContextTypes.DEFAULT_TYPE, frames, duration_per_frame: float, on_done):
+    """
+    Plays `frames` on the job's message one job per frame, then runs `on_done` with the
+    original job data. Nothing sleeps in between, so the worker is free across frames.
+    Frames are due at absolute times from now, so edit latency doesn't stretch the animation.
+    """
+    job_data = context.job.data
+    start = datetime.now(timezone.utc)
+    context.job_queue.run_once(
+        _animation_frame_job, start,
+        data={
+            'chat_id': job_data['chat_id'],
+            'message_id': job_data['message_id'],
+            'frames_remaining': tuple(frames),
+            'next_at': start,
+            'duration_per_frame': duration_per_frame,
+            'on_done': on_done,
+            'done_data': job_data,
+        },
+        name=context.job.name
+    )
+
+
+async def _animation_frame_job(context: ContextTypes.DEFAULT_TYPE):
+    """Edits the next animation frame and reschedules itself until the frames run out."""
+    data = context.job.data
+    frames = data['frames_remaining']
+    chat_id, message_id = data['chat_id'], data['message_id']
+
+    try:
+        async with _ANIM_SEM:
+            await throttled_edit(context.bot, chat_id, message_id, frames[0], parse_mode=_MD)
+        frames = frames[1:]
+    except Exception as edit_err:
+        # A failed frame only cuts the animation short; on_done still runs
+        logger.warning(f"Failed to edit animation message {message_id}: {edit_err}. Stopping animation.")
+        frames = ()
+
+    if frames:
+        next_at = data['next_at'] + timedelta(seconds=data['duration_per_frame'])
+        context.job_queue.run_once(
+            _animation_frame_job, next_at,
+            data={**data, 'frames_remaining': frames, 'next_at': next_at}, name=context.job.name
+        )
+    else:
+        # on_done may edit the message directly, so keep clear of the per-message edit limit
+        done_at = max(data['next_at'] + timedelta(seconds=data['duration_per_frame']),
+                      datetime.now(timezone.utc) + timedelta(seconds=config.EDIT_MIN_INTERVAL))
+        context.job_queue.run_once(data['on_done'], done_at, data=data['done_data'], name=context.job.name)
+
+
 async def _mission_completion_job(context: ContextTypes.DEFAULT_TYPE):
     """The job that runs when a mission is complete."""
+    _spawn(_mission_completion_impl(context))
+
+
+async def _mission_completion_impl(context: ContextTypes.DEFAULT_TYPE):
     job_data = context.job.data
     user_id = job_data.get('user_id')
     mission_rank = job_data.get('mission_rank')
@@ -168,81 +346,88 @@ async def _mission_completion_job(context: ContextTypes.DEFAULT_TYPE):
          logger.error(f"Mission completion job missing essential data: {job_data}")
          return
 
-    logger.info(f"Running mission completion job for user {user_id}, mission {mission_rank}.")
+    job_name = context.job.name
+    if _ACTIVE_JOBS.get(user_id) != job_name:
+         logger.info(f"Mission job {job_name} no longer owns user {user_id}'s activity. Skipping.")
+         return
 
-    player = await get_player(user_id)
-    mission = MISSIONS.get(mission_rank)
+    try:
+        logger.info(f"Running mission completion job for user {user_id}, mission {mission_rank}.")
 
-    if not player:
-        logger.warning(f"Player {user_id} not found for mission completion job.")
-        return
+        player = await get_player_cached(user_id)
+        mission = MISSIONS.get(mission_rank)
+
+        if not player:
+            logger.warning(f"Player {user_id} not found for mission completion job.")
+            _release_activity(user_id, job_name)
+            return
     
-    if not mission or not isinstance(mission, dict) or 'name' not in mission:
-         logger.error(f"Mission rank '{mission_rank}' not found or invalid in MISSIONS for completion job.")
-         if player.current_mission and mission_rank in player.current_mission:
-              logger.warning(f"Clearing potentially related mission status '{player.current_mission}' for player {user_id}")
-              player.current_mission = None
-              player.mark_modified()
-              player.save() # <-- THIS LINE WAS FIXED
-         return
+        if not mission:
+             logger.error(f"Mission rank '{mission_rank}' not found in MISSIONS for completion job.")
+             if player.is_doing('mission', mission_rank):
+                  logger.warning(f"Clearing mission status '{player.current_mission}' for player {user_id}")
+                  player.clear_activity()
+                  player_writer.enqueue(player)
+             _release_activity(user_id, job_name)
+             return
+
+        if not player.is_doing('mission', mission_rank):
+             logger.warning(f"Player {user_id} is no longer on mission '{mission['name']}' (current: {player.current_mission}). Job aborted.")
+             _release_activity(user_id, job_name)
+             return
+
+        # --- Animate Completion ---
+        animation_frames, duration_per_frame = _MISSION_SCHEDULES[mission_rank]
+        if not animation_frames:
+             await _mission_reward_job(context)
+             return
+        _schedule_animation(context, animation_frames, duration_per_frame, _mission_reward_job)
+    except Exception as e:
+        logger.error(f"Mission completion job {job_name} failed for user {user_id}: {e}", exc_info=True)
+        _abandon_activity(user_id, job_name, 'mission', mission_rank)
+
+
+async def _mission_reward_job(context: ContextTypes.DEFAULT_TYPE):
+    """Grants mission rewards once the completion animation has finished, then frees the user."""
+    job_data = context.job.data
+    try:
+        await _grant_mission_rewards(context)
+    except Exception as e:
+        logger.error(f"Mission reward job {context.job.name} failed for user {job_data['user_id']}: {e}", exc_info=True)
+        _abandon_activity(job_data['user_id'], context.job.name, 'mission', job_data['mission_rank'])
+    finally:
+        _release_activity(job_data['user_id'], context.job.name)
 
-    if player.current_mission != mission['name']:
-         logger.warning(f"Player {user_id} is no longer on mission '{mission['name']}' (current: {player.current_mission}). Job aborted.")
-         return
 
+async def _grant_mission_rewards(context: ContextTypes.DEFAULT_TYPE):
+    job_data = context.job.data
+    user_id = job_data['user_id']
+    mission_rank = job_data['mission_rank']
+    chat_id = job_data['chat_id']
+    message_id = job_data['message_id']
+    mission = MISSIONS[mission_rank]
     bot = context.bot
 
-    # --- Animate Completion ---
-    try:
-        frames = mission.get('animation_frames', [])
-        animation_frames = frames[1:] if len(frames) > 1 else frames
-        
-        if not animation_frames:
-             logger.warning(f"No animation frames (or only 1) defined for mission '{mission_rank}'. Skipping animation.")
-        else:
-            total_anim_duration = max(5.0, mission.get('duration_sec', 30) * 0.2)
-            duration_per_frame = max(config.ANIMATION_DELAY, total_anim_duration / len(animation_frames))
-
-            for frame in animation_frames:
-                try:
-                    await bot.edit_message_text(
-                        chat_id=chat_id, message_id=message_id,
-                        text=frame, parse_mode=ParseMode.MARKDOWN
-                    )
-                    await asyncio.sleep(duration_per_frame)
-                except Exception as edit_err:
-                    logger.warning(f"Failed to edit mission message {message_id} (frame): {edit_err}. Stopping animation.")
-                    try:
-                         await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=frames[-1], parse_mode=ParseMode.MARKDOWN)
-                    except: 
-                        pass
-                    break
-
-            final_frame = frames[-1] if frames else "Mission animation error."
-            try:
-                 await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=final_frame, parse_mode=ParseMode.MARKDOWN)
-            except Exception as final_edit_err:
-                 logger.warning(f"Failed to set final animation frame for mission {message_id}: {final_edit_err}")
-
-    except Exception as anim_e:
-        logger.error(f"Mission animation failed unexpectedly for user {user_id}: {anim_e}", exc_info=True)
-        try:
-             final_frame = mission.get('animation_frames', ["Mission error."])[-1]
-             await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=final_frame, parse_mode=ParseMode.MARKDOWN)
-        except Exception as fallback_e:
-             logger.error(f"Failed to set fallback final frame for mission {message_id} after error: {fallback_e}")
+    player = await get_player_cached(user_id)
+    if not player or not player.is_doing('mission', mission_rank):
+         logger.warning(f"Player {user_id} is no longer on mission '{mission['name']}'. Rewards skipped.")
+         return
 
     # --- Grant Rewards ---
     try:
-        exp_reward = mission.get('exp', 0)
-        ryo_reward = mission.get('ryo', 0)
+        exp_reward = mission['exp']
+        ryo_reward = mission['ryo']
 
         level_up_msg, exp_msg = player.add_exp(exp_reward)
-
         player.ryo += ryo_reward
-        player.current_mission = None
         player.mark_modified()
-        player.save()
+        player.clear_activity()
+        if not await player.asave():
+            # Never show rewards that aren't stored; keep them queued for another attempt
+            logger.error(f"Rewards for mission '{mission_rank}', user {user_id} were not saved. Retrying in the background.")
+            player_writer.enqueue(player)
+            await bot.send_message(chat_id, f"Mission {mission['name']} is complete, but your rewards couldn't be saved yet. They will be retried shortly.")
+            return
 
         logger.info(f"Mission '{mission_rank}' completed by player {user_id}. Rewarded {exp_reward} EXP, {ryo_reward} Ryo.")
 
@@ -250,27 +435,89 @@ async def _mission_completion_job(context: ContextTypes.DEFAULT_TYPE):
         if level_up_msg:
              reward_message += f"\n\n{level_up_msg}"
 
-        await bot.send_message(chat_id, reward_message, parse_mode=ParseMode.MARKDOWN)
+        # Rewards are stored, so the job needn't wait on Telegram
+        context.application.create_task(
+            _send_mission_result(bot, user_id, chat_id, message_id, mission['animation_frames'][-1], reward_message),
+            name=f"reward_{user_id}"
+        )
 
     except Exception as reward_e:
          logger.error(f"Failed to grant rewards for mission '{mission_rank}', user {user_id}: {reward_e}", exc_info=True)
-         await bot.send_message(chat_id, f"An error occurred while granting rewards for mission {mission.get('name', mission_rank)}. Please contact support.")
-         if player and player.current_mission == mission.get('name'):
-              player.current_mission = None
-              player.mark_modified()
-              player.save()
-
+         await bot.send_message(chat_id, f"An error occurred while granting rewards for mission {mission['name']}. Please contact support.")
+         if player and player.is_doing('mission', mission_rank):
+              player.clear_activity()
+              player_writer.enqueue(player)
+
+
+async def _send_mission_result(bot, user_id: int, chat_id: int, message_id: int, final_frame: str, reward_message: str):
+    """Shows the final frame and reward summary, in one edit when it fits."""
+    final_text = f"{final_frame}\n\n{reward_message}"
+    if len(final_text) > MessageLimit.MAX_TEXT_LENGTH:
+        # Too long for one message: show the frame and send the reward concurrently
+        results = await asyncio.gather(
+            bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=final_frame, parse_mode=_MD),
+            bot.send_message(chat_id, reward_message, parse_mode=_MD),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Mission completion message for {user_id} failed: {result}")
+        return
+    try:
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=final_text, parse_mode=_MD)
+    except (TelegramError, asyncio.TimeoutError) as edit_err:
+        logger.warning(f"Failed to edit mission message {message_id} with rewards: {edit_err}. Sending instead.")
+        await bot.send_message(chat_id, reward_message, parse_mode=_MD)
 
 # --- Training Handlers ---
 
-async def train_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# TRAINING_ANIMATIONS is fixed at import, so the help texts are built once
+_TRAIN_USAGE_TEXT = (
+    "Which skill do you want to train?\n"
+    "Usage: `/train [type]`\n\n"
+    "Available Training:\n" +
+    "\n".join(f" - `{key}` ({details['description']})" for key, details in TRAINING_ANIMATIONS.items())
+)
+_TRAIN_INVALID_TEXT = (
+    "Invalid training type '{}'. Valid types: " + ", ".join(f"`{k}`" for k in TRAINING_ANIMATIONS) + "."
+)
+
+# Stats a training can raise, and the resource topped up alongside each one
+_TRAINABLE_STATS = {
+    'strength': None,
+    'speed': None,
+    'stamina': Player.restore_hp,
+    'intelligence': Player.restore_chakra,
+}
+
+def _stat_applier(stat: str, restore):
+    def apply(player: Player, gain: int):
+        setattr(player, stat, getattr(player, stat) + gain)
+        if restore:
+            restore(player, 10)
+    return apply
+
+def _build_stat_appliers() -> dict:
+    """Maps train_type -> apply(player, gain), resolved once at import."""
+    appliers = {}
+    for key, training in TRAINING_ANIMATIONS.items():
+        stat = training['stat']
+        if stat not in _TRAINABLE_STATS:
+            logger.error(f"Stat '{stat}' in training '{key}' does not exist on Player.")
+            continue
+        appliers[key] = _stat_applier(stat, _TRAINABLE_STATS[stat])
+    return appliers
+
+_STAT_APPLIERS = _build_stat_appliers()
+
+@with_player
+async def train_command(update: Update, context: ContextTypes.DEFAULT_TYPE, player: Optional[Player]):
     """Handles the /train command."""
     user_id = update.effective_user.id
     if not user_id: 
         return
     logger.debug(f"Received /train command from {user_id} with args: {context.args}")
     
-    player = await get_player(user_id)
     if not player:
         await update.message.reply_text("You must /start your journey first.")
         return
@@ -281,45 +528,44 @@ async def train_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     args = context.args
     if not args:
-        available_training = "\n".join([f" - `{key}` ({details.get('description', 'Stat Increase')})"
-                                        for key, details in TRAINING_ANIMATIONS.items()])
-        await update.message.reply_text(
-            "Which skill do you want to train?\n"
-            "Usage: `/train [type]`\n\n"
-            f"Available Training:\n{available_training}",
-            parse_mode=ParseMode.MARKDOWN
-        )
+        await update.message.reply_text(_TRAIN_USAGE_TEXT, parse_mode=_MD)
         return
 
     train_type = args[0].lower()
     training = TRAINING_ANIMATIONS.get(train_type)
 
-    if not training or not isinstance(training, dict):
-        valid_types = ", ".join([f"`{k}`" for k in TRAINING_ANIMATIONS.keys()])
-        await update.message.reply_text(f"Invalid training type '{train_type}'. Valid types: {valid_types}.", parse_mode=ParseMode.MARKDOWN)
+    if not training:
+        await update.message.reply_text(_TRAIN_INVALID_TEXT.format(train_type), parse_mode=_MD)
         return
 
-    required_keys = ['duration_sec', 'frames', 'stat', 'gain', 'display_name', 'description']
-    if not all(k in training for k in required_keys) or not training['frames']:
-         logger.error(f"Training definition for '{train_type}' is incomplete or invalid.")
-         await update.message.reply_text("This training is currently unavailable due to configuration error.")
-         return
+    job_name = f"train_{user_id}_{train_type}_{next(_JOB_SEQ)}"
+    if not _claim_activity(user_id, job_name):
+        await update.message.reply_text("You cannot train while starting another activity.")
+        return
 
-    run_at = datetime.now(timezone.utc) + timedelta(seconds=training['duration_sec'])
+    run_in = training['duration_sec'] # Relative delay; JobQueue resolves it against its own clock
     start_frame = training['frames'][0]
     
     try:
-        message = await update.message.reply_text(start_frame, parse_mode=ParseMode.MARKDOWN)
+        message = await update.message.reply_text(start_frame, parse_mode=_MD)
+        note_message_text(message.chat_id, message.message_id, start_frame)
 
         if not context.job_queue:
             logger.error("JobQueue is not available in context. Cannot schedule training completion.")
             await message.edit_text("Error: Cannot schedule training completion. Please contact admin.")
+            _release_activity(user_id, job_name)
+            return
+
+        player.start_activity('train', train_type, f"Training {training['display_name']}")
+        if not await player.asave():
+            logger.error(f"Could not save training '{train_type}' start for player {user_id}. Not scheduled.")
+            _abandon_activity(user_id, job_name, 'train', train_type)
+            await message.edit_text("Failed to start training: your progress couldn't be saved. Please try again.")
             return
 
-        job_name = f"train_{user_id}_{train_type}_{int(datetime.now().timestamp())}"
         context.job_queue.run_once(
             _training_completion_job,
-            run_at,
+            run_in,
             data={
                 'user_id': player.user_id,
                 'chat_id': message.chat_id,
@@ -328,19 +574,20 @@ async def train_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             },
             name=job_name
         )
-        logger.info(f"Scheduled training '{train_type}' ({job_name}) for player {user_id} to complete at {run_at}.")
-
-        player.current_mission = f"Training {training.get('display_name', train_type.capitalize())}"
-        player.mark_modified()
-        player.save()
+        logger.info(f"Scheduled training '{train_type}' ({job_name}) for player {user_id} to complete in {run_in}s.")
 
     except Exception as e:
         logger.error(f"Failed to start training '{train_type}' for player {user_id}: {e}", exc_info=True)
+        _abandon_activity(user_id, job_name, 'train', train_type)
         await update.message.reply_text("Failed to start training due to an error.")
 
 
 async def _training_completion_job(context: ContextTypes.DEFAULT_TYPE):
     """The job that runs when training is complete."""
+    _spawn(_training_completion_impl(context))
+
+
+async def _training_completion_impl(context: ContextTypes.DEFAULT_TYPE):
     job_data = context.job.data
     user_id = job_data.get('user_id')
     train_type = job_data.get('train_type')
@@ -351,105 +598,97 @@ async def _training_completion_job(context: ContextTypes.DEFAULT_TYPE):
          logger.error(f"Training completion job missing essential data: {job_data}")
          return
 
-    logger.info(f"Running training completion job for user {user_id}, type {train_type}.")
+    job_name = context.job.name
+    if _ACTIVE_JOBS.get(user_id) != job_name:
+         logger.info(f"Training job {job_name} no longer owns user {user_id}'s activity. Skipping.")
+         return
 
-    player = await get_player(user_id)
-    training = TRAINING_ANIMATIONS.get(train_type)
+    try:
+        logger.info(f"Running training completion job for user {user_id}, type {train_type}.")
 
-    if not player:
-        logger.warning(f"Player {user_id} not found for training job.")
-        return
+        player = await get_player_cached(user_id)
+        training = TRAINING_ANIMATIONS.get(train_type)
+
+        if not player:
+            logger.warning(f"Player {user_id} not found for training job.")
+            _release_activity(user_id, job_name)
+            return
     
-    if not training or not isinstance(training, dict):
-        logger.error(f"Training type '{train_type}' not found or invalid in TRAINING_ANIMATIONS.")
-        if player.current_mission and train_type in player.current_mission:
-             player.current_mission = None
-             player.mark_modified()
-             player.save()
-        return
+        if not training:
+            logger.error(f"Training type '{train_type}' not found in TRAINING_ANIMATIONS.")
+            if player.is_doing('train', train_type):
+                 player.clear_activity()
+                 player_writer.enqueue(player)
+            _release_activity(user_id, job_name)
+            return
 
-    if not all(k in training for k in ['stat', 'gain', 'display_name']):
-         logger.error(f"Training definition for '{train_type}' missing reward keys (stat/gain/display_name).")
-         if player.current_mission and train_type in player.current_mission:
-              player.current_mission = None
-              player.mark_modified()
-              player.save()
-         return
+        if not player.is_doing('train', train_type):
+             logger.warning(f"Player {user_id} is no longer training '{train_type}' (current: {player.current_mission}). Job aborted.")
+             _release_activity(user_id, job_name)
+             return
 
-    expected_status = f"Training {training.get('display_name', train_type.capitalize())}"
-    if player.current_mission != expected_status:
-         logger.warning(f"Player {user_id} is no longer training '{train_type}' (current: {player.current_mission}). Job aborted.")
-         return
+        # --- Play Animation ---
+        frames, duration_per_frame = _TRAINING_SCHEDULES[train_type]
+        _schedule_animation(context, frames, duration_per_frame, _training_reward_job)
+    except Exception as e:
+        logger.error(f"Training completion job {job_name} failed for user {user_id}: {e}", exc_info=True)
+        _abandon_activity(user_id, job_name, 'train', train_type)
 
-    bot = context.bot
 
-    # --- Play Animation ---
+async def _training_reward_job(context: ContextTypes.DEFAULT_TYPE):
+    """Applies the trained stat gain once the training animation has finished, then frees the user."""
+    job_data = context.job.data
     try:
-        frames = training.get('frames', [])
-        if frames:
-            total_anim_duration = max(3.0, training.get('duration_sec', 30) * 0.15)
-            duration_per_frame = max(config.ANIMATION_DELAY, total_anim_duration / len(frames))
-
-            for frame in frames:
-                try:
-                    await bot.edit_message_text(
-                        chat_id=chat_id, message_id=message_id,
-                        text=frame, parse_mode=ParseMode.MARKDOWN
-                    )
-                    await asyncio.sleep(duration_per_frame)
-                except Exception as edit_err:
-                    logger.warning(f"Failed to edit training message {message_id}: {edit_err}")
-                    break
-    except Exception as anim_e:
-        logger.error(f"Training animation failed for user {user_id}: {anim_e}", exc_info=True)
+        await _grant_training_rewards(context)
+    except Exception as e:
+        logger.error(f"Training reward job {context.job.name} failed for user {job_data['user_id']}: {e}", exc_info=True)
+        _abandon_activity(job_data['user_id'], context.job.name, 'train', job_data['train_type'])
+    finally:
+        _release_activity(job_data['user_id'], context.job.name)
+
+
+async def _grant_training_rewards(context: ContextTypes.DEFAULT_TYPE):
+    job_data = context.job.data
+    user_id = job_data['user_id']
+    train_type = job_data['train_type']
+    chat_id = job_data['chat_id']
+    training = TRAINING_ANIMATIONS[train_type]
+    bot = context.bot
+
+    player = await get_player_cached(user_id)
+    if not player or not player.is_doing('train', train_type):
+         logger.warning(f"Player {user_id} is no longer training '{train_type}'. Rewards skipped.")
+         return
 
     # --- Grant Rewards ---
     try:
         stat_to_gain = training['stat']
         gain_amount = training['gain']
 
-        if hasattr(player, stat_to_gain):
-            current_value = getattr(player, stat_to_gain)
-            if isinstance(gain_amount, (int, float)) and gain_amount > 0:
-                 setattr(player, stat_to_gain, current_value + gain_amount)
-                 player.mark_modified()
-
-                 hp_updated = False
-                 chakra_updated = False
-                 if stat_to_gain == 'stamina':
-                     player.max_hp = 100 + (player.stamina * 10)
-                     player.current_hp = min(player.max_hp, player.current_hp + 10)
-                     player.mark_modified()
-                     hp_updated = True
-                 elif stat_to_gain == 'intelligence':
-                     player.max_chakra = 100 + (player.intelligence * 5)
-                     player.current_chakra = min(player.max_chakra, player.current_chakra + 10)
-                     player.mark_modified()
-                     chakra_updated = True
-
-            else:
-                 logger.error(f"Invalid gain amount '{gain_amount}' for training '{train_type}'.")
-        else:
-             logger.error(f"Stat '{stat_to_gain}' in training '{train_type}' does not exist on Player.")
+        apply_gain = _STAT_APPLIERS.get(train_type)
 
-        player.current_mission = None
-        player.mark_modified()
-        player.save()
+        if apply_gain:
+            apply_gain(player, gain_amount)
+        player.clear_activity()
+        if not await player.asave():
+            logger.error(f"Gains for training '{train_type}', user {user_id} were not saved. Retrying in the background.")
+            player_writer.enqueue(player)
+            await bot.send_message(chat_id, f"Your training ({training['display_name']}) is complete, but the gains couldn't be saved yet. They will be retried shortly.")
+            return
 
         logger.info(f"Training '{train_type}' completed by player {user_id}. Gained {gain_amount} {stat_to_gain}.")
 
     except Exception as reward_e:
          logger.error(f"Failed to grant rewards for training '{train_type}', user {user_id}: {reward_e}", exc_info=True)
-         await bot.send_message(chat_id, f"An error occurred completing your training ({training.get('display_name', train_type)}).")
-         if player and player.current_mission == expected_status:
-              player.current_mission = None
-              player.mark_modified()
-              player.save()
+         await bot.send_message(chat_id, f"An error occurred completing your training ({training['display_name']}).")
+         if player and player.is_doing('train', train_type):
+              player.clear_activity()
+              player_writer.enqueue(player)
 
 
 def register_activity_handlers(application: Application):
     logger.debug("Registering activity handlers...")
     application.add_handler(CommandHandler('missions', missions_command))
-    application.add_handler(CallbackQueryHandler(mission_callback, pattern='^mission_'))
+    application.add_handler(CallbackQueryHandler(mission_callback, pattern=_MISSION_CALLBACK_RE))
     application.add_handler(CommandHandler('train', train_command))
     logger.debug("Activity handlers registered.")
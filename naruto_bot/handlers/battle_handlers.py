@@ -1,30 +1,100 @@
 # naruto_bot/handlers/battle_handlers.py
 import logging
-import uuid
+import secrets
 import asyncio
 import json
 import sqlite3
+import re
+from functools import lru_cache
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Any
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
     CommandHandler,
+    CallbackQueryHandler,
     ContextTypes,
     MessageHandler,
     filters
 )
 from telegram.constants import ParseMode
-from ..models import get_player, Player
+from ..models import get_player_cached, Player, player_writer
 from ..cache import cache_manager
 from ..config import config
-from ..battle import Battle, battle_animation_flow
+from ..battle import Battle, battle_animation_flow, battle_rewards
 from ..services import get_jutsu_by_name
-from ..database import get_db_connection
-from ..game_data import JUTSU_LIBRARY
+from ..database import write_connection
+from ..game_data import BATTLE_JUTSU_KEYS, JUTSU_LIBRARY
+
+try:
+    import orjson # Optional: much faster encoding of long battle logs
+except ImportError:
+    orjson = None
 
 logger = logging.getLogger(__name__)
 
+# --- Battle Message Editor ---
+
+class BattleMessageEditor:
+    """
+    Gives the animation code a message-like edit_text() bound to the battle message.
+    Edits repeating what the message already shows are skipped; that fingerprint lives on the
+    Battle, so it carries across turns.
+    """
+    def __init__(self, bot, battle: Battle):
+        self.bot = bot
+        self.battle = battle
+    
+    async def edit_text(self, text, parse_mode=ParseMode.MARKDOWN, reply_markup=None):
+        if not self.battle.render_changed(text, reply_markup is not None):
+            return # Telegram would reject it as "message is not modified"
+        await self.send_edit(text, parse_mode, reply_markup)
+
+    async def send_edit(self, text, parse_mode=ParseMode.MARKDOWN, reply_markup=None):
+        """Edits unconditionally; for callers that already checked battle.render_changed()."""
+        battle = self.battle
+        if not battle.battle_message_id:
+            return
+        try:
+            await self.bot.edit_message_text(
+                chat_id=battle.chat_id, message_id=battle.battle_message_id,
+                text=text, parse_mode=parse_mode, reply_markup=reply_markup
+            )
+        except Exception as e:
+            battle.last_text_hash = None # Unknown what is shown now; don't skip the next edit
+            logger.warning(f"Failed to edit battle message {battle.battle_message_id}: {e}")
+
+# --- Battle State Cache ---
+
+# Fields a turn can change; everything else is written once when the battle starts
+_BATTLE_TURN_FIELDS = ('turn', 'turn_count', 'players', 'last_action_time', 'last_text_hash')
+
+async def _save_battle(battle: Battle, fields: Optional[tuple] = None):
+    """
+    Stores the battle state under its battle_id: `fields` only (all if None), plus any
+    log lines appended since the last save.
+    """
+    state = battle.to_dict()
+    log = state.pop('log')
+    if fields is not None:
+        state = {field: state[field] for field in fields}
+    await cache_manager.save_battle_state(battle.battle_id, state, log[battle.log_saved:],
+                                          ttl=config.BATTLE_CACHE_TTL, max_log=config.BATTLE_LOG_MAXLEN)
+    # Mirror the cache-side trim so the in-memory log stays bounded too
+    del battle.log[:-config.BATTLE_LOG_MAXLEN]
+    battle.log_saved = len(battle.log)
+
+async def _load_battle(battle_id: str) -> Optional[Battle]:
+    """Returns the cached Battle, or None if it expired or can't be decoded."""
+    state = await cache_manager.load_battle_state(battle_id)
+    if not state:
+        return None
+    try:
+        return Battle.from_dict(state)
+    except (KeyError, TypeError, ValueError) as e:
+        logger.error(f"Corrupt battle state for {battle_id}: {e}")
+        return None
+
 # --- Battle Initiation ---
 
 async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -34,7 +104,7 @@ async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     logger.debug(f"Received /battle command from {user_id}")
     
-    challenger = await get_player(user_id)
+    challenger = await get_player_cached(user_id)
     if not challenger:
         await update.message.reply_text("You must /start your journey first.")
         return
@@ -72,7 +142,7 @@ async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("You cannot challenge bots (for now!).")
         return
 
-    opponent = await get_player(opponent_user.id)
+    opponent = await get_player_cached(opponent_user.id)
     opponent_name = opponent_user.first_name or f"User {opponent_user.id}"
     if not opponent:
         await update.message.reply_text(f"{opponent_name} hasn't started their ninja journey yet.")
@@ -94,7 +164,7 @@ async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # --- Start Battle ---
     logger.info(f"Battle initiated: {challenger.username} vs {opponent.username} (IDs: {challenger.user_id} vs {opponent.user_id})")
 
-    battle_id = f"battle_{uuid.uuid4()}"
+    battle_id = f"b_{secrets.token_hex(8)}"
     try:
         battle = Battle(challenger, opponent, battle_id)
         battle.chat_id = update.message.chat_id
@@ -105,14 +175,12 @@ async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     logger.debug(f"Battle object created with ID: {battle_id}")
 
-    # Set locks and cache mappings
+    # Lock both players in first; the rest of the state is written once the message exists
     try:
-        await cache_manager.set_battle_lock(challenger.user_id, opponent.user_id)
-        await cache_manager.set_battle_lock(opponent.user_id, challenger.user_id)
-        await cache_manager.set_data("battle_state", battle_id, battle, ttl=config.BATTLE_CACHE_TTL)
-        await cache_manager.set_data("user_battle_id", str(challenger.user_id), battle_id, ttl=config.BATTLE_CACHE_TTL)
-        await cache_manager.set_data("user_battle_id", str(opponent.user_id), battle_id, ttl=config.BATTLE_CACHE_TTL)
-        logger.debug(f"Battle state and user mappings cached for battle {battle_id}.")
+        await cache_manager.set_many([
+            ("battle_lock", challenger.user_id, opponent.user_id),
+            ("battle_lock", opponent.user_id, challenger.user_id)
+        ], ttl=config.BATTLE_CACHE_TTL)
     except Exception as cache_e:
          logger.error(f"Failed to set up battle cache for {battle_id}: {cache_e}", exc_info=True)
          await update.message.reply_text("Failed to initialize battle state. Please try again.")
@@ -121,18 +189,16 @@ async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # --- Send Initial Battle Message ---
     try:
-        turn_player_id = battle.turn
-        turn_player_obj = await get_player(turn_player_id)
-        if not turn_player_obj: 
-            raise ValueError(f"Could not load player data for starting turn: {turn_player_id}")
+        turn_player_obj = challenger if battle.turn == challenger.user_id else opponent
 
         logger.debug(f"First turn: {turn_player_obj.username}. Building keyboard.")
-        keyboard = build_jutsu_keyboard(turn_player_obj)
-        reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
+        reply_markup = build_jutsu_keyboard(turn_player_obj, battle_id)
 
         battle_text = battle.get_battle_state_text()
         if not battle_text: 
             raise ValueError("get_battle_state_text returned empty.")
+        battle_text += f"\n\n⚔️ Battle Start! ⚔️\nIt's {turn_player_obj.username}'s turn!"
+        battle.render_changed(battle_text, with_keyboard=True)
 
         logger.debug(f"Sending initial battle message for {battle_id} to chat {battle.chat_id}")
         message = await update.message.reply_text(
@@ -142,13 +208,14 @@ async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         battle.battle_message_id = message.message_id
-        await cache_manager.set_data("battle_state", battle_id, battle, ttl=config.BATTLE_CACHE_TTL)
-        logger.debug(f"Battle message ID {message.message_id} saved for {battle_id}.")
-
-        await context.bot.send_message(
-             chat_id=battle.chat_id,
-             text=f"⚔️ Battle Start! ⚔️\nIt's {turn_player_obj.username}'s turn!"
+        await asyncio.gather(
+            _save_battle(battle),
+            cache_manager.set_many([
+                ("user_battle_id", challenger.user_id, battle_id),
+                ("user_battle_id", opponent.user_id, battle_id)
+            ], ttl=config.BATTLE_CACHE_TTL)
         )
+        logger.debug(f"Battle state and user mappings cached for battle {battle_id}.")
 
     except Exception as e:
         logger.error(f"Error sending initial battle message for {battle_id}: {e}", exc_info=True)
@@ -156,48 +223,78 @@ async def battle_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await _cleanup_battle_cache(battle_id, challenger.user_id, opponent.user_id)
 
 
-# --- Handling Turns (/use) ---
+# --- Handling Turns (/use and jutsu buttons) ---
 
-async def use_jutsu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles jutsu usage via /use command or ReplyKeyboard press."""
-    user = update.effective_user
-    if not user: 
-        return
-    logger.debug(f"Received /use handler trigger from {user.id}")
+# Button callback_data: "u:<battle tag>:<jutsu key>" to use a jutsu, "f:<battle tag>" to flee.
+# The tag ties a keyboard to the battle it was built for, so stale buttons are rejected.
+_BATTLE_CALLBACK_RE = re.compile(r'^(?P<action>[uf]):(?P<tag>[^:]+)(?::(?P<key>\w*))?$')
+
+def _battle_tag(battle_id: str) -> str:
+    return battle_id[-8:]
 
-    player = await get_player(user.id)
+
+async def _check_turn(user_id: int, jutsu_key: str, battle_tag: Optional[str] = None):
+    """
+    Validates that `user_id` may use `jutsu_key` now.
+    Returns (error_text, None) on failure or (None, (player, battle, jutsu_data)).
+    """
+    # Independent lookups: load the player and their battle pointer together
+    player, battle_id = await asyncio.gather(
+        get_player_cached(user_id),
+        cache_manager.get_data("user_battle_id", str(user_id))
+    )
     if not player:
-         await update.message.reply_text("Cannot find your player data.", reply_markup=ReplyKeyboardRemove())
-         return
+         return "Cannot find your player data.", None
 
     # Check if player is in battle
-    battle_id = await cache_manager.get_data("user_battle_id", str(user.id))
-    if not battle_id:
-        await update.message.reply_text("You are not currently in a battle.", reply_markup=ReplyKeyboardRemove())
-        return
+    if not battle_id or (battle_tag is not None and _battle_tag(battle_id) != battle_tag):
+        return "You are not currently in a battle.", None
+
+    # Wrong-turn presses are common; reject them from the small 'turn' field alone
+    turn = await cache_manager.get_battle_field(battle_id, 'turn')
+    if turn is not None and turn != user_id:
+        return "Patience, shinobi! It's not your turn.", None
 
     # Retrieve battle state
-    battle = await cache_manager.get_data("battle_state", battle_id)
-    if not battle or not isinstance(battle, Battle):
-        logger.warning(f"Battle state {battle_id} missing/invalid for player {user.id} using jutsu.")
-        await _cleanup_battle_cache(battle_id, user.id, None)
-        await update.message.reply_text("Your battle data expired or was lost. The battle ends.", reply_markup=ReplyKeyboardRemove())
-        return
+    battle = await _load_battle(battle_id)
+    if not battle:
+        logger.warning(f"Battle state {battle_id} missing/invalid for player {user_id} using jutsu.")
+        await _cleanup_battle_cache(battle_id, user_id, None)
+        return "Your battle data expired or was lost. The battle ends.", None
 
     # Check turn
-    if battle.turn != user.id:
-        await update.message.reply_text("Patience, shinobi! It's not your turn.")
+    if battle.turn != user_id:
+        return "Patience, shinobi! It's not your turn.", None
+
+    jutsu_data = JUTSU_LIBRARY.get(jutsu_key)
+    if not jutsu_data:
+        return "No usable battle jutsus known!", None
+
+    # Check if known
+    if jutsu_key not in player.known_jutsus:
+        return f"You haven't mastered {jutsu_data['name']} yet!", None
+
+    # Check Chakra cost against the battle snapshot, which is the live value mid-battle
+    chakra_cost = jutsu_data.get('chakra_cost', 0)
+    current_chakra = battle.get_player_data(user_id)['current_chakra']
+    if current_chakra < chakra_cost:
+        return f"Not enough chakra! {jutsu_data['name']} needs {chakra_cost}, you have {current_chakra}.", None
+
+    return None, (player, battle, jutsu_data)
+
+
+async def use_jutsu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles jutsu usage typed as /use <jutsu name>."""
+    user = update.effective_user
+    if not user: 
         return
+    logger.debug(f"Received /use handler trigger from {user.id}")
 
-    # Parse jutsu name
-    jutsu_name_input = ""
-    if update.message.text.startswith('/use '):
-         jutsu_name_input = update.message.text[5:].strip()
-    elif context.args:
-        jutsu_name_input = ' '.join(context.args)
+    # Parse jutsu name; CommandHandler has already split the text after /use into args
+    jutsu_name_input = ' '.join(context.args) if context.args else ""
 
     if not jutsu_name_input:
-         await update.message.reply_text("Which jutsu will you use? (Select from keyboard)")
+         await update.message.reply_text("Which jutsu will you use? (Select from the battle buttons)")
          return
 
     # Find the jutsu
@@ -205,63 +302,56 @@ async def use_jutsu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not jutsu_result:
         await update.message.reply_text(f"Unknown jutsu: '{jutsu_name_input}'.")
         return
-    
-    jutsu_key, jutsu_data = jutsu_result
 
-    # Check if known
-    if jutsu_key not in player.known_jutsus:
-        await update.message.reply_text(f"You haven't mastered {jutsu_data['name']} yet!")
+    jutsu_key = jutsu_result[0]
+    error, turn = await _check_turn(user.id, jutsu_key)
+    if error:
+        await update.message.reply_text(error)
         return
+    await _run_turn(context, *turn, jutsu_key)
 
-    # Check Chakra cost
-    chakra_cost = jutsu_data.get('chakra_cost', 0)
-    if player.current_chakra < chakra_cost:
-        await update.message.reply_text(f"Not enough chakra! {jutsu_data['name']} needs {chakra_cost}, you have {player.current_chakra}.")
+
+async def battle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles the inline jutsu and flee buttons on battle messages."""
+    query = update.callback_query
+    match = context.matches[0]
+    user = query.from_user
+
+    if match.group('action') == 'f':
+        error = await _flee(context, user.id, user.first_name, battle_tag=match.group('tag'))
+        await query.answer(error, show_alert=bool(error))
+        return
+
+    jutsu_key = match.group('key') or ''
+    error, turn = await _check_turn(user.id, jutsu_key, battle_tag=match.group('tag'))
+    # Answer before the animation starts so the button stops spinning
+    await query.answer(error, show_alert=bool(error))
+    if error:
         return
+    await _run_turn(context, *turn, jutsu_key)
+
+
+async def _run_turn(context: ContextTypes.DEFAULT_TYPE, player: Player, battle: Battle, jutsu_data: dict, jutsu_key: str):
+    """Executes a validated turn: pays chakra, animates, then ends the battle or passes the turn."""
+    battle_id = battle.battle_id
+    user_id = player.user_id
 
     # --- Execute Turn ---
     logger.info(f"Battle {battle_id}: Player {player.username} uses {jutsu_data['name']}")
 
-    # Get opponent object
-    opponent_id = await cache_manager.get_battle_opponent(user.id)
-    if not opponent_id:
-         logger.error(f"Opponent ID missing in cache for player {user.id}, battle {battle_id}.")
-         await _end_battle(context, battle, "Internal error: Opponent missing.", winner_id=None)
-         return
-    
-    opponent = await get_player(opponent_id)
+    # Get opponent object (the battle state already names both players)
+    opponent_id = battle.player2_id if battle.player1_id == user_id else battle.player1_id
+    opponent = await get_player_cached(opponent_id)
     if not opponent:
          logger.error(f"Opponent player data (ID: {opponent_id}) missing for battle {battle_id}.")
-         await _end_battle(context, battle, "Internal error: Opponent data missing.", winner_id=user.id)
+         await _end_battle(context, battle, "Internal error: Opponent data missing.", winner_id=user_id)
          return
 
-    # Deduct chakra and save player state
-    player.current_chakra -= chakra_cost
-    player.mark_modified()
-    player.save()
-
-    # Update chakra in the cached battle state
-    battle.update_player_resource(user.id, 'current_chakra', player.current_chakra)
-
-    # Message editor helper class
-    class BattleMessageEditor:
-        def __init__(self, bot, chat_id, message_id):
-            self.bot = bot
-            self.chat_id = chat_id
-            self.message_id = message_id
-        
-        async def edit_text(self, text, parse_mode=ParseMode.MARKDOWN, reply_markup=None):
-            if not self.message_id: 
-                return
-            try:
-                await self.bot.edit_message_text(
-                    chat_id=self.chat_id, message_id=self.message_id,
-                    text=text, parse_mode=parse_mode, reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.warning(f"Failed to edit battle message {self.message_id}: {e}")
+    # Deduct chakra in the battle state only; _end_battle persists it once the battle is over
+    attacker_data = battle.get_player_data(user_id)
+    battle.update_player_resource(user_id, 'current_chakra', attacker_data['current_chakra'] - jutsu_data.get('chakra_cost', 0))
 
-    battle_message = BattleMessageEditor(context.bot, battle.chat_id, battle.battle_message_id)
+    battle_message = BattleMessageEditor(context.bot, battle)
 
     # Call battle logic/animation
     winner_id = None
@@ -284,8 +374,7 @@ async def use_jutsu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"Battle {battle_id} concluded. Winner: {winner_id}")
         await battle_message.edit_text(battle.get_battle_state_text(), parse_mode=ParseMode.MARKDOWN)
 
-        winner_player = await get_player(winner_id)
-        winner_name = winner_player.username if winner_player else f"Player {winner_id}"
+        winner_name = (player if winner_id == user_id else opponent).username
 
         await context.bot.send_message(
             battle.chat_id,
@@ -296,52 +385,49 @@ async def use_jutsu_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await _end_battle(context, battle, f"{winner_name} won.", winner_id=winner_id)
         return
 
-    # Switch Turns
+    # Switch Turns (the opponent loaded above is always the next player)
     battle.switch_turn()
-    next_turn_player_id = battle.turn
 
-    await cache_manager.set_data("battle_state", battle_id, battle, ttl=config.BATTLE_CACHE_TTL)
+    # One edit shows the new state, whose turn it is and their jutsu buttons. Record it before
+    # saving so the stored fingerprint matches the screen; skip it if the screen is unchanged.
+    turn_text = f"{battle.get_battle_state_text()}\n\nIt's {opponent.username}'s turn!"
+    changed = battle.render_changed(turn_text, with_keyboard=True)
 
-    # Get next player object for keyboard
-    next_player = await get_player(next_turn_player_id)
-    if not next_player:
-         logger.error(f"Could not load next player {next_turn_player_id} in battle {battle_id}.")
-         await _end_battle(context, battle, "Internal error loading next player.", winner_id=None)
-         return
-
-    keyboard = build_jutsu_keyboard(next_player)
-    reply_markup = ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=True)
-
-    await battle_message.edit_text(battle.get_battle_state_text(), parse_mode=ParseMode.MARKDOWN)
+    await _save_battle(battle, _BATTLE_TURN_FIELDS)
 
-    await context.bot.send_message(
-        battle.chat_id,
-        f"It's {next_player.username}'s turn!",
-        reply_markup=reply_markup
-    )
+    if changed:
+        await battle_message.send_edit(
+            turn_text, parse_mode=ParseMode.MARKDOWN,
+            reply_markup=build_jutsu_keyboard(opponent, battle_id)
+        )
 
 
 async def flee_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Allows a player to flee a battle."""
-    user_id = update.effective_user.id
-    if not user_id: 
+    user = update.effective_user
+    if not user: 
         return
 
+    error = await _flee(context, user.id, user.first_name)
+    if error:
+        await update.message.reply_text(error, reply_markup=ReplyKeyboardRemove())
+
+
+async def _flee(context: ContextTypes.DEFAULT_TYPE, user_id: int, fleeing_player_name: str,
+                battle_tag: Optional[str] = None) -> Optional[str]:
+    """Ends the user's battle in the opponent's favour. Returns an error text if there is nothing to flee."""
     battle_id = await cache_manager.get_data("user_battle_id", str(user_id))
-    if not battle_id:
-        await update.message.reply_text("You are not in a battle.", reply_markup=ReplyKeyboardRemove())
-        return
+    if not battle_id or (battle_tag is not None and _battle_tag(battle_id) != battle_tag):
+        return "You are not in a battle."
 
-    battle = await cache_manager.get_data("battle_state", battle_id)
-    if not battle or not isinstance(battle, Battle):
+    battle = await _load_battle(battle_id)
+    if not battle:
         await _cleanup_battle_cache(battle_id, user_id, None)
-        await update.message.reply_text("Your battle data was not found.", reply_markup=ReplyKeyboardRemove())
-        return
+        return "Your battle data was not found."
 
     winner_id = battle.player2_id if battle.player1_id == user_id else battle.player1_id
-    fleeing_player_name = update.effective_user.first_name
 
-    winner_player = await get_player(winner_id)
+    winner_player = await get_player_cached(winner_id)
     winner_name = winner_player.username if winner_player else f"Player {winner_id}"
 
     logger.info(f"Battle {battle.battle_id}: Player {user_id} ({fleeing_player_name}) fled. Winner: {winner_id} ({winner_name}).")
@@ -356,6 +442,8 @@ async def flee_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     battle.log.append(f"{fleeing_player_name} fled.")
     await _end_battle(context, battle, f"{winner_name} won by default.", winner_id=winner_id)
+    return None
+
     # --- Battle Cleanup and Logging ---
 
 async def _cleanup_battle_cache(battle_id: str, player1_id: Optional[int], player2_id: Optional[int]):
@@ -363,21 +451,27 @@ async def _cleanup_battle_cache(battle_id: str, player1_id: Optional[int], playe
      if not battle_id: 
          return
      logger.debug(f"Cleaning up cache entries for battle {battle_id}")
-     tasks = [cache_manager.delete_data("battle_state", battle_id)]
-     if player1_id:
-          tasks.append(cache_manager.delete_data("user_battle_id", str(player1_id)))
-          tasks.append(cache_manager.delete_data("battle_lock", str(player1_id)))
-     if player2_id:
-          tasks.append(cache_manager.delete_data("user_battle_id", str(player2_id)))
-          tasks.append(cache_manager.delete_data("battle_lock", str(player2_id)))
-     await asyncio.gather(*tasks)
+     keys = [("battle_state", battle_id), ("battle_log", battle_id)]
+     for player_id in (player1_id, player2_id):
+          if player_id:
+               keys.append(("user_battle_id", str(player_id)))
+               keys.append(("battle_lock", str(player_id)))
+     await cache_manager.delete_many(keys)
      logger.debug(f"Cache cleanup complete for battle {battle_id}")
 
 
+def _apply_battle_chakra(battle: Battle, player: Player):
+    """Copies the chakra left at the end of the battle onto the persistent player."""
+    chakra = battle.get_player_data(player.user_id)['current_chakra']
+    if player.current_chakra != chakra:
+        player.current_chakra = chakra
+        player.mark_modified()
+
+
 async def _end_battle(context: ContextTypes.DEFAULT_TYPE, battle: Battle, end_reason: str, winner_id: Optional[int]):
     """Cleans up cache, updates player stats, sends messages, and logs history."""
 
-    if not isinstance(battle, Battle) or not battle.battle_id:
+    if not battle or not battle.battle_id:
          logger.error(f"_end_battle called with invalid Battle object: {battle}")
          return
 
@@ -392,71 +486,87 @@ async def _end_battle(context: ContextTypes.DEFAULT_TYPE, battle: Battle, end_re
     elif winner_id == p2_id:
       loser_id = p1_id
 
-    # Clean up cache FIRST
-    await _cleanup_battle_cache(battle.battle_id, p1_id, p2_id)
+    # Nothing below reads the battle keys again, so the cache cleanup overlaps the stat updates
+    context.application.create_task(
+        _cleanup_battle_cache(battle.battle_id, p1_id, p2_id),
+        name=f"battle_cleanup_{battle.battle_id}"
+    )
 
     # Update Player Stats & Send DMs
     if winner_id and loser_id:
         try:
-            winner = await get_player(winner_id)
-            loser = await get_player(loser_id)
+            winner, loser = await asyncio.gather(get_player_cached(winner_id), get_player_cached(loser_id))
 
             if winner and loser:
-                level_diff = max(0, loser.level - winner.level)
-                exp_gain = max(10, (loser.level * 10) + 25 + (level_diff * 5))
-                ryo_gain = max(20, (loser.level * 5) + 50 + (level_diff * 10))
+                exp_gain, ryo_gain = battle_rewards(winner.level, loser.level)
 
                 logger.debug(f"Battle {battle.battle_id}: Winner {winner_id} gains {exp_gain} EXP, {ryo_gain} Ryo.")
 
+                _apply_battle_chakra(battle, winner)
+                _apply_battle_chakra(battle, loser)
+
                 # Update winner
                 level_up_msg, exp_msg = winner.add_exp(exp_gain)
                 winner.ryo += ryo_gain
                 winner.wins += 1
                 winner.mark_modified()
                 winner.set_cooldown('battle', 60)
-                winner.save()
 
                 # Update loser
                 loser.losses += 1
                 loser.mark_modified()
                 loser.set_cooldown('battle', 30)
-                loser.save()
-
-                # Send result messages via DM
-                try:
-                    await context.bot.send_message(
-                        winner_id,
-                        f"**VICTORY!**\n"
-                        f"You defeated {loser.username}!\n"
-                        f"You earned {ryo_gain} Ryo 💰.\n{exp_msg}"
-                        f"{('\n\n'+level_up_msg) if level_up_msg else ''}",
-                        parse_mode=ParseMode.MARKDOWN
-                    )
-                except Exception as dm_err:
-                     logger.warning(f"Could not send victory DM to winner {winner_id}: {dm_err}")
-
-                try:
-                    await context.bot.send_message(
-                        loser_id,
-                        f"**DEFEAT...**\n"
-                        f"You were defeated by {winner.username}.",
-                        parse_mode=ParseMode.MARKDOWN
+
+                # History is bookkeeping only; nothing user-facing waits on it
+                context.application.create_task(
+                    _log_battle_history(p1_id, p2_id, battle.log, winner_id=winner_id),
+                    name=f"battle_history_{battle.battle_id}"
+                )
+
+                # Results are announced only once both rows are committed
+                if not await Player.asave_many([winner, loser]):
+                    logger.error(f"Battle {battle.battle_id}: saving winner {winner_id} and loser {loser_id} failed. Retrying in the background.")
+                    player_writer.enqueue(winner)
+                    player_writer.enqueue(loser)
+                    pending_text = "The battle is over, but the results couldn't be saved yet. They will be retried shortly."
+                    notices = ((winner_id, pending_text, None), (loser_id, pending_text, None))
+                else:
+                    notices = (
+                        (winner_id,
+                         f"**VICTORY!**\n"
+                         f"You defeated {loser.username}!\n"
+                         f"You earned {ryo_gain} Ryo 💰.\n{exp_msg}"
+                         f"{('\n\n'+level_up_msg) if level_up_msg else ''}",
+                         ParseMode.MARKDOWN),
+                        (loser_id,
+                         f"**DEFEAT...**\n"
+                         f"You were defeated by {winner.username}.",
+                         ParseMode.MARKDOWN),
                     )
-                except Exception as dm_err:
-                     logger.warning(f"Could not send defeat DM to loser {loser_id}: {dm_err}")
 
-                _log_battle_history(p1_id, p2_id, battle.log, winner_id=winner_id)
+                # The two DMs are independent; send them together
+                results = await asyncio.gather(
+                    *(context.bot.send_message(user_id, text, parse_mode=parse_mode) for user_id, text, parse_mode in notices),
+                    return_exceptions=True
+                )
+                for (user_id, _, _), result in zip(notices, results):
+                    if isinstance(result, Exception):
+                        logger.warning(f"Battle {battle.battle_id}: result DM to {user_id} failed: {result}")
 
             else:
                  logger.error(f"Could not load winner ({winner_id}) or loser ({loser_id}) object for battle {battle.battle_id}.")
 
         except Exception as e:
             logger.error(f"Error updating player stats after battle {battle.battle_id}: {e}", exc_info=True)
-            try:
-                 await context.bot.send_message(p1_id, "An error occurred updating stats after the battle.", disable_notification=True)
-                 await context.bot.send_message(p2_id, "An error occurred updating stats after the battle.", disable_notification=True)
-            except: 
-                pass
+            error_text = "An error occurred updating stats after the battle."
+            results = await asyncio.gather(
+                context.bot.send_message(p1_id, error_text, disable_notification=True),
+                context.bot.send_message(p2_id, error_text, disable_notification=True),
+                return_exceptions=True
+            )
+            for user_id, result in zip((p1_id, p2_id), results):
+                if isinstance(result, Exception):
+                    logger.warning(f"Battle {battle.battle_id}: error notice to {user_id} failed: {result}")
 
     elif winner_id is None:
          logger.info(f"Battle {battle.battle_id} ended without a clear winner. Reason: {end_reason}.")
@@ -465,27 +575,44 @@ async def _end_battle(context: ContextTypes.DEFAULT_TYPE, battle: Battle, end_re
          except Exception as msg_err:
               logger.warning(f"Could not send inconclusive battle message for {battle.battle_id}: {msg_err}")
 
-         _log_battle_history(p1_id, p2_id, battle.log, winner_id=None)
-
-
-def _log_battle_history(player1_id: int, player2_id: int, log: list[str], winner_id: Optional[int]):
-    """Saves the battle log to the database (synchronous)."""
+         players = [p for p in await asyncio.gather(get_player_cached(p1_id), get_player_cached(p2_id)) if p]
+         for player in players:
+              _apply_battle_chakra(battle, player)
+         context.application.create_task(
+              _log_battle_history(p1_id, p2_id, battle.log, winner_id=None),
+              name=f"battle_history_{battle.battle_id}"
+         )
+         if not await Player.asave_many(players):
+              logger.warning(f"Battle {battle.battle_id}: saving inconclusive result failed. Retrying in the background.")
+              for player in players:
+                   player_writer.enqueue(player)
+
+
+_BATTLE_HISTORY_SQL = """
+INSERT INTO battle_history (player1_id, player2_id, winner_id, battle_log, fought_at)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+def _insert_battle_history(params: tuple):
+    """Writes one battle_history row on the shared writer connection (executor thread)."""
+    with write_connection() as conn:
+        conn.execute(_BATTLE_HISTORY_SQL, params)
+
+
+async def _log_battle_history(player1_id: int, player2_id: int, log: list[str], winner_id: Optional[int]):
+    """Saves the battle log to the database without blocking the event loop."""
+    # Encode before handing off, so the writer connection is held only for the INSERT
+    log = log[-config.BATTLE_LOG_MAXLEN:]
     try:
-        log_json = json.dumps(log)
+        log_json = orjson.dumps(log).decode() if orjson else json.dumps(log)
     except TypeError:
         logger.error("Failed to serialize battle log to JSON. Log content might be invalid.")
         log_json = json.dumps(["Error serializing log."])
 
-    sql = """
-    INSERT INTO battle_history (player1_id, player2_id, winner_id, battle_log, fought_at)
-    VALUES (?, ?, ?, ?, ?)
-    """
     now_iso = datetime.now(timezone.utc).isoformat()
 
     try:
-        with get_db_connection() as conn:
-            conn.execute(sql, (player1_id, player2_id, winner_id, log_json, now_iso))
-            conn.commit()
+        await asyncio.to_thread(_insert_battle_history, (player1_id, player2_id, winner_id, log_json, now_iso))
         logger.info(f"Battle history logged: P1={player1_id}, P2={player2_id}, Winner={winner_id}")
     except sqlite3.Error as e:
         logger.error(f"Failed to log battle history to DB: {e}", exc_info=True)
@@ -493,34 +620,42 @@ def _log_battle_history(player1_id: int, player2_id: int, log: list[str], winner
          logger.error(f"Unexpected error logging battle history: {e}", exc_info=True)
 
 
-def build_jutsu_keyboard(player: Player) -> list[list[str]]:
-    """Creates a ReplyKeyboardMarkup list of lists for usable jutsus."""
+@lru_cache(maxsize=1024)
+def _jutsu_keyboard_rows(known_jutsus: tuple[str, ...]) -> tuple[tuple[tuple[str, str], ...], ...]:
+    """Builds (label, jutsu_key) button rows for a jutsu set in one pass; memoized per set."""
     keyboard_buttons = []
     row = []
 
-    valid_jutsu_keys = [
-        key for key in player.known_jutsus
-        if key in JUTSU_LIBRARY and isinstance(JUTSU_LIBRARY[key], dict)
-    ]
-
-    for jutsu_key in valid_jutsu_keys:
-        jutsu = JUTSU_LIBRARY[jutsu_key]
-        if jutsu.get('power', 0) > 0 or 'effect' in jutsu:
-            jutsu_name = jutsu.get('name', jutsu_key)
-            row.append(f"/use {jutsu_name}")
+    for jutsu_key in known_jutsus:
+        if jutsu_key in BATTLE_JUTSU_KEYS:
+            row.append((JUTSU_LIBRARY[jutsu_key]['name'], jutsu_key))
             if len(row) == 2:
-                keyboard_buttons.append(row)
+                keyboard_buttons.append(tuple(row))
                 row = []
 
     if row:
-        keyboard_buttons.append(row)
+        keyboard_buttons.append(tuple(row))
+
+    if not keyboard_buttons:
+        keyboard_buttons.append((("No usable battle jutsus known!", ''),))
+
+    return tuple(keyboard_buttons)
 
-    keyboard_buttons.append(["/flee"])
 
-    if not valid_jutsu_keys or not any(JUTSU_LIBRARY[key].get('power', 0) > 0 or 'effect' in JUTSU_LIBRARY[key] for key in valid_jutsu_keys):
-        keyboard_buttons.insert(0, ["No usable battle jutsus known!"])
+@lru_cache(maxsize=1024)
+def _jutsu_keyboard_markup(known_jutsus: tuple[str, ...], tag: str) -> InlineKeyboardMarkup:
+    """Builds the markup for a jutsu set in one battle; PTB objects are immutable, so it is shared."""
+    keyboard = [
+        [InlineKeyboardButton(label, callback_data=f"u:{tag}:{key}") for label, key in row]
+        for row in _jutsu_keyboard_rows(known_jutsus)
+    ]
+    keyboard.append([InlineKeyboardButton("🏃 Flee", callback_data=f"f:{tag}")])
+    return InlineKeyboardMarkup(keyboard)
+
 
-    return keyboard_buttons
+def build_jutsu_keyboard(player: Player, battle_id: str) -> InlineKeyboardMarkup:
+    """Returns the inline jutsu/flee keyboard for `player` in battle `battle_id`."""
+    return _jutsu_keyboard_markup(tuple(player.known_jutsus), _battle_tag(battle_id))
 
 
 def register_battle_handlers(application: Application):
@@ -528,4 +663,5 @@ def register_battle_handlers(application: Application):
     application.add_handler(CommandHandler('battle', battle_command))
     application.add_handler(CommandHandler('use', use_jutsu_handler))
     application.add_handler(CommandHandler('flee', flee_command))
+    application.add_handler(CallbackQueryHandler(battle_callback, pattern=_BATTLE_CALLBACK_RE))
     logger.debug("Battle handlers registered.")  
@@ -231,6 +231,22 @@ async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Could not display your profile due to an error.")
 
 
+_HELP_TEXT = (
+    "**📜 Available Commands 📜**\n\n"
+    "**Core Gameplay:**\n"
+    "`/start` - Start your ninja journey\n"
+    "`/profile` - Check your stats and progress\n"
+    "`/battle @username` - Challenge another player (reply to their msg)\n"
+    "`/train [type]` - Train stats (`taijutsu`, `chakra_control`, `stamina`, `speed`)\n"
+    "`/missions` - View and start available missions\n\n"
+    "**Jutsu System:**\n"
+    "`/jutsus` - List your learned jutsus\n"
+    "`/combine [signs]` - Try hand signs (e.g., `/combine tiger snake bird`)\n"
+    "`/use [jutsu]` - Use a jutsu in battle (use keyboard)\n\n"
+    "`/help` - Show this message"
+)
+
+
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Displays the help message with available commands."""
     user = update.effective_user
@@ -238,22 +254,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     logger.debug(f"Received /help command from {user.id}")
 
-    help_text = (
-        "**📜 Available Commands 📜**\n\n"
-        "**Core Gameplay:**\n"
-        "`/start` - Start your ninja journey\n"
-        "`/profile` - Check your stats and progress\n"
-        "`/battle @username` - Challenge another player (reply to their msg)\n"
-        "`/train [type]` - Train stats (`taijutsu`, `chakra_control`, `stamina`, `speed`)\n"
-        "`/missions` - View and start available missions\n\n"
-        "**Jutsu System:**\n"
-        "`/jutsus` - List your learned jutsus\n"
-        "`/combine [signs]` - Try hand signs (e.g., `/combine tiger snake bird`)\n"
-        "`/use [jutsu]` - Use a jutsu in battle (use keyboard)\n\n"
-        "`/help` - Show this message"
-    )
     try:
-        await update.message.reply_text(help_text, parse_mode=ParseMode.MARKDOWN)
+        await update.message.reply_text(_HELP_TEXT, parse_mode=ParseMode.MARKDOWN)
         logger.debug(f"Help message sent to {user.id}")
     except Exception as e:
         logger.error(f"Failed to send help message to {user.id}: {e}", exc_info=True)
@@ -9,7 +9,7 @@ from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes
 from telegram.constants import ParseMode
 from ..models import get_player, Player
-from ..game_data import JUTSU_LIBRARY, HAND_SIGNS
+from ..game_data import JUTSU_LIBRARY, HAND_SIGNS, HAND_SIGNS_SET
 from ..services import validate_hand_signs, get_jutsu_by_signs
 from ..database import get_db_connection
 from ..animations import animate_jutsu_discovery
@@ -91,7 +91,7 @@ async def combine_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Validate signs
     if not validate_hand_signs(signs):
-        invalid_signs = [s for s in signs if s not in HAND_SIGNS]
+        invalid_signs = [s for s in signs if s not in HAND_SIGNS_SET]
         await update.message.reply_text(
             f"Invalid hand sign(s) detected: `{', '.join(invalid_signs)}`.\n"
             f"Available signs: `{', '.join(HAND_SIGNS)}`",
@@ -140,7 +140,7 @@ async def combine_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode=ParseMode.MARKDOWN
         )
         if player.add_jutsu(jutsu_key):
-            player.save()
+            await player.asave()
         logger.debug(f"Player {user_id} tried already discovered combination '{combo_str}'.")
         return
 
@@ -150,7 +150,7 @@ async def combine_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Add to player's lists and save
     player.add_discovered_combination(combo_str)
     player.add_jutsu(jutsu_key)
-    player.save()
+    await player.asave()
 
     # Log discovery globally (synchronous)
     _log_jutsu_discovery(combo_str, jutsu_key, player)
@@ -2,6 +2,9 @@ import logging
 import json
 import sqlite3
 import asyncio # Import asyncio
+import time
+import weakref
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional, Tuple
 
@@ -18,6 +21,10 @@ logger = logging.getLogger(__name__)
 class Player:
     """Represents a player in the Naruto RPG bot."""
 
+    # Class-level defaults for objects unpickled from caches written before these existed
+    current_activity_kind: Optional[str] = None
+    current_activity_key: Optional[str] = None
+
     def __init__(self, user_id: int, username: str, village: str, level: int = 1,
                  exp: int = 0, total_exp: int = 0, max_hp: int = 100, current_hp: int = 100,
                  max_chakra: int = 100, current_chakra: int = 100, chakra_regen_rate: int = 5,
@@ -26,7 +33,8 @@ class Player:
                  equipment: dict = None, ryo: int = 100, rank: str = 'Academy Student',
                  wins: int = 0, losses: int = 0, current_mission: Optional[str] = None,
                  battle_cooldown: Optional[str] = None, last_regen: Optional[str] = None,
-                 created_at: Optional[str] = None):
+                 created_at: Optional[str] = None, current_activity_kind: Optional[str] = None,
+                 current_activity_key: Optional[str] = None):
 
         self.user_id = user_id
         self.username = username
@@ -34,17 +42,14 @@ class Player:
         self.level = level
         self.exp = exp
         self.total_exp = total_exp
-        # Calculate max_hp based on stamina
-        self.max_hp = 100 + (stamina * 10)
-        self.current_hp = min(current_hp, self.max_hp) # Ensure current isn't > max on load
-        # Calculate max_chakra based on intelligence
-        self.max_chakra = 100 + (intelligence * 5)
-        self.current_chakra = min(current_chakra, self.max_chakra) # Ensure current isn't > max
         self.chakra_regen_rate = chakra_regen_rate # Chakra points per 5 minutes
         self.strength = strength
         self.speed = speed
         self.intelligence = intelligence
         self.stamina = stamina
+        # max_hp / max_chakra are derived from stamina / intelligence (see properties below)
+        self.current_hp = min(current_hp, self.max_hp) # Ensure current isn't > max on load
+        self.current_chakra = min(current_chakra, self.max_chakra) # Ensure current isn't > max
         self.known_jutsus = known_jutsus if known_jutsus is not None else []
         self.discovered_combinations = discovered_combinations if discovered_combinations is not None else []
         self.equipment = equipment if equipment is not None else {}
@@ -52,7 +57,9 @@ class Player:
         self.rank = rank
         self.wins = wins
         self.losses = losses
-        self.current_mission = current_mission
+        self.current_mission = current_mission # Display text for the current activity
+        self.current_activity_kind = current_activity_kind # 'mission' | 'train' | None
+        self.current_activity_key = current_activity_key # Mission rank / training type
         self.battle_cooldown = battle_cooldown # ISO format string
         self.last_regen = last_regen # ISO format string
         self.created_at = created_at or datetime.now(timezone.utc).isoformat()
@@ -66,6 +73,44 @@ class Player:
         """Flags the player object as modified."""
         self._modified = True
 
+    def start_activity(self, kind: str, key: str, display: str):
+        """Marks the player busy with a mission/training; `display` is what other players see."""
+        self.current_activity_kind = kind
+        self.current_activity_key = key
+        self.current_mission = display
+        self.mark_modified()
+
+    def clear_activity(self):
+        """Marks the player as no longer busy."""
+        self.current_activity_kind = None
+        self.current_activity_key = None
+        self.current_mission = None
+        self.mark_modified()
+
+    def is_doing(self, kind: str, key: str) -> bool:
+        """True if the player's current activity is exactly (kind, key)."""
+        return self.current_activity_key == key and self.current_activity_kind == kind
+
+    @property
+    def max_hp(self) -> int:
+        """Max HP, derived from stamina."""
+        return 100 + (self.stamina * 10)
+
+    @property
+    def max_chakra(self) -> int:
+        """Max Chakra, derived from intelligence."""
+        return 100 + (self.intelligence * 5)
+
+    def restore_hp(self, amount: int):
+        """Restores HP, capped at max_hp."""
+        self.current_hp = min(self.max_hp, self.current_hp + amount)
+        self.mark_modified()
+
+    def restore_chakra(self, amount: int):
+        """Restores Chakra, capped at max_chakra."""
+        self.current_chakra = min(self.max_chakra, self.current_chakra + amount)
+        self.mark_modified()
+
     def get_village_bonus(self) -> Tuple[str, float]:
         """Returns the element and bonus multiplier for the player's village."""
         village_data = VILLAGES.get(self.village)
@@ -218,27 +263,23 @@ class Player:
             self.exp -= exp_needed
             level_up_messages.append(f"🎉 **LEVEL UP!** You reached Level {self.level}! 🎉")
 
+            old_max_hp = self.max_hp
+            old_max_chakra = self.max_chakra
+
             # Stat growth (+6 points auto-distributed)
             # Example: +2 stamina, +1 str, +1 spd, +1 int, +1 chakra_regen_rate
+            # (max HP/Chakra follow stamina/intelligence automatically)
             self.stamina += 2
             self.strength += 1
             self.speed += 1
             self.intelligence += 1
             # self.chakra_regen_rate += 1 # Or maybe increase max chakra/regen rate slightly?
 
-            # Recalculate max HP/Chakra
-            old_max_hp = self.max_hp
-            old_max_chakra = self.max_chakra
-            self.max_hp = 100 + (self.stamina * 10)
-            self.max_chakra = 100 + (self.intelligence * 5)
-
             # Heal/Restore partially on level up (e.g., heal difference + 25%)
             hp_increase = self.max_hp - old_max_hp
             chakra_increase = self.max_chakra - old_max_chakra
-            heal_amount = hp_increase + int(self.max_hp * 0.25)
-            chakra_restore_amount = chakra_increase + int(self.max_chakra * 0.25)
-            self.current_hp = min(self.max_hp, self.current_hp + heal_amount)
-            self.current_chakra = min(self.max_chakra, self.current_chakra + chakra_restore_amount)
+            self.restore_hp(hp_increase + int(self.max_hp * 0.25))
+            self.restore_chakra(chakra_increase + int(self.max_chakra * 0.25))
 
             level_up_messages.append(
                 f"💪 Stats increased! (+2 STA, +1 STR, +1 SPD, +1 INT)\n"
@@ -299,26 +340,22 @@ class Player:
 
     # --- Database Operations ---
 
-    def save(self):
-        """Saves the player's current state to the database and updates cache."""
-        # Use hasattr for robustness, ensure _modified exists before checking
-        if not hasattr(self, '_modified') or not self._modified:
-            # logger.debug(f"Player {self.user_id} save skipped, no modifications detected.")
-            return
+    # Ensure all fields match the database schema
+    _SAVE_SQL = """
+    UPDATE players SET
+        username = ?, village = ?, level = ?, exp = ?, total_exp = ?,
+        max_hp = ?, current_hp = ?, max_chakra = ?, current_chakra = ?,
+        chakra_regen_rate = ?, strength = ?, speed = ?, intelligence = ?, stamina = ?,
+        known_jutsus = ?, discovered_combinations = ?, equipment = ?, ryo = ?,
+        rank = ?, wins = ?, losses = ?, current_mission = ?, battle_cooldown = ?,
+        last_regen = ?, current_activity_kind = ?, current_activity_key = ?
+    WHERE user_id = ?
+    """
 
-        # Ensure all fields match the database schema
-        sql = """
-        UPDATE players SET
-            username = ?, village = ?, level = ?, exp = ?, total_exp = ?,
-            max_hp = ?, current_hp = ?, max_chakra = ?, current_chakra = ?,
-            chakra_regen_rate = ?, strength = ?, speed = ?, intelligence = ?, stamina = ?,
-            known_jutsus = ?, discovered_combinations = ?, equipment = ?, ryo = ?,
-            rank = ?, wins = ?, losses = ?, current_mission = ?, battle_cooldown = ?,
-            last_regen = ?
-        WHERE user_id = ?
-        """
+    def _save_params(self) -> tuple:
+        """Parameters for _SAVE_SQL, in column order."""
         # Ensure lists/dicts are saved as valid JSON strings, handle None cases
-        params = (
+        return (
             self.username, self.village, self.level, self.exp, self.total_exp,
             self.max_hp, self.current_hp, self.max_chakra, self.current_chakra,
             self.chakra_regen_rate, self.strength, self.speed, self.intelligence, self.stamina,
@@ -327,13 +364,23 @@ class Player:
             json.dumps(self.equipment or {}),
             self.ryo, self.rank, self.wins, self.losses,
             self.current_mission, self.battle_cooldown, self.last_regen,
+            self.current_activity_kind, self.current_activity_key,
             self.user_id
         )
 
+    def save(self):
+        """Saves the player's current state to the database and updates cache."""
+        # Use hasattr for robustness, ensure _modified exists before checking
+        if not hasattr(self, '_modified') or not self._modified:
+            # logger.debug(f"Player {self.user_id} save skipped, no modifications detected.")
+            return
+
+        params = self._save_params()
+
         try:
             with get_db_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(sql, params)
+                cursor.execute(self._SAVE_SQL, params)
                 conn.commit()
                 # Verify update occurred (rowcount indicates rows affected)
                 if cursor.rowcount == 0:
@@ -342,8 +389,7 @@ class Player:
                      # Let's keep it True so the next save attempt happens.
                 else:
                      logger.info(f"Player {self.user_id} ({self.username}) data saved to database.")
-                     # --- FIX: REMOVED CONFLICTING ASYNCIO CALL ---
-                     # asyncio.create_task(cache_manager.set_data("players", str(self.user_id), self, ttl=config.PLAYER_CACHE_TTL))
+                     _publish_player(self) # Write-through to the in-process and Redis caches
                      self._modified = False # Reset modified flag ONLY on successful save
 
         except sqlite3.Error as e:
@@ -354,6 +400,18 @@ class Player:
             # Do not reset _modified flag on other errors
 
 
+    async def asave(self) -> bool:
+        """
+        Saves through player_writer and returns True once committed (False if the write failed).
+        The snapshot is taken on the event loop and the write is ordered with any write-behind flush.
+        """
+        return await player_writer.write([self])
+
+    @staticmethod
+    async def asave_many(players: List['Player']) -> bool:
+        """Like asave(), for several players in a single transaction."""
+        return await player_writer.write(players)
+
     @classmethod
     def _load_from_db(cls, user_id: int) -> Optional['Player']:
         """Loads player data directly from the database (synchronous helper)."""
@@ -398,6 +456,9 @@ class Player:
                 try:
                      # Filter player_data to only include keys expected by __init__
                      init_data = {key: player_data[key] for key in required_keys if key in player_data}
+                     for key in ('current_activity_kind', 'current_activity_key'): # Added later; optional
+                         if key in player_data:
+                             init_data[key] = player_data[key]
                      player = cls(**init_data)
                      # Don't cache here, let get_player handle it
                      return player
@@ -470,6 +531,163 @@ async def get_player(user_id: int) -> Optional[Player]:
          return None
 
 
+# --- In-Process Player Cache ---
+# Cache-aside layer in front of get_player, kept fresh by committed saves (write-through).
+
+_local_players: "OrderedDict[int, Tuple[float, Player]]" = OrderedDict()
+_player_load_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+_cache_refresh_tasks: set = set() # Strong references to in-flight Redis refreshes
+
+def _remember_player(player: Player):
+    """Stores a player in the in-process cache, evicting the least recently used entries."""
+    _local_players[player.user_id] = (time.monotonic() + config.LOCAL_PLAYER_CACHE_TTL, player)
+    _local_players.move_to_end(player.user_id)
+    while len(_local_players) > config.LOCAL_PLAYER_CACHE_SIZE:
+        _local_players.popitem(last=False)
+
+def _publish_player(player: Player):
+    """
+    Write-through after a committed save: refreshes the in-process cache and the Redis copy
+    that get_player falls back to. Must run on the event loop to reach Redis.
+    """
+    _remember_player(player)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return # No loop (sync caller): the Redis copy just ages out after PLAYER_CACHE_TTL
+    task = loop.create_task(cache_manager.set_data("players", str(player.user_id), player, ttl=config.PLAYER_CACHE_TTL))
+    _cache_refresh_tasks.add(task)
+    task.add_done_callback(_cache_refresh_done)
+
+def _cache_refresh_done(task: asyncio.Task):
+    _cache_refresh_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.warning(f"Failed to refresh cached player in Redis: {task.exception()}")
+
+def _recall_player(user_id: int) -> Optional[Player]:
+    """Returns the in-process cached player, or None if absent or expired."""
+    entry = _local_players.get(user_id)
+    if entry is None:
+        return None
+    expires_at, player = entry
+    if expires_at < time.monotonic():
+        _local_players.pop(user_id, None)
+        return None
+    _local_players.move_to_end(user_id)
+    return player
+
+def peek_player(user_id: int) -> Optional[Player]:
+    """Returns the player from the in-process cache without loading it, or None."""
+    return _recall_player(user_id)
+
+async def get_player_cached(user_id: int) -> Optional[Player]:
+    """
+    Like get_player, but served from process memory when possible.
+    Concurrent misses for the same user share a single backend load.
+    """
+    player = _recall_player(user_id)
+    if player is not None:
+        return player
+
+    lock = _player_load_locks.get(user_id)
+    if lock is None:
+        lock = _player_load_locks[user_id] = asyncio.Lock()
+    async with lock:
+        player = _recall_player(user_id)
+        if player is None:
+            player = await get_player(user_id)
+            if player:
+                _remember_player(player)
+    return player
+
+
+# --- Write-Behind Player Writer ---
+
+class PlayerWriter:
+    """
+    Write-behind queue for player saves. Players enqueued within one flush window
+    are coalesced (latest state wins) and written in a single DB transaction.
+    Awaited saves (Player.asave) go through write(), serialized with the flushes.
+    """
+
+    def __init__(self, flush_interval: float = 0.2, max_batch: int = 100):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._write_lock = asyncio.Lock() # One write at a time, so a newer snapshot always lands last
+
+    def enqueue(self, player: Player):
+        """Queues a player for the next batched write. Must be called from the event loop."""
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        self._queue.put_nowait(player)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = {}
+            player = await self._queue.get()
+            batch[player.user_id] = player
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                try:
+                    player = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                batch[player.user_id] = player
+            await self._flush(list(batch.values()))
+
+    async def write(self, players: List[Player]) -> bool:
+        """
+        Writes `players` now. Returns True once every modified player is committed,
+        False if any write failed (those players stay flagged as modified).
+        """
+        return await self._flush(players)
+
+    async def _flush(self, players: List[Player]) -> bool:
+        async with self._write_lock:
+            # Snapshot on the loop thread; anything modified after this re-flags _modified
+            rows = []
+            for player in players:
+                if getattr(player, '_modified', False):
+                    rows.append((player, player._save_params()))
+                    player._modified = False
+            if not rows:
+                return True
+            try:
+                written = await asyncio.get_running_loop().run_in_executor(
+                    None, self._write_rows, [params for _, params in rows]
+                )
+            except Exception as e:
+                logger.error(f"Write of {len(rows)} players failed: {e}", exc_info=True)
+                written = [False] * len(rows)
+            for (player, _), ok in zip(rows, written):
+                if ok:
+                    _publish_player(player)
+                else:
+                    logger.warning(f"Failed to update player {player.user_id} in DB (user might not exist?). Modifications not saved.")
+                    player._modified = True # Retry on the next save
+            return all(written)
+
+    @staticmethod
+    def _write_rows(param_rows: List[tuple]) -> List[bool]:
+        """Runs all updates in one transaction (executor thread). Returns per-row success."""
+        results = []
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            for params in param_rows:
+                cursor.execute(Player._SAVE_SQL, params)
+                results.append(cursor.rowcount > 0)
+            conn.commit()
+        logger.info(f"Saved {sum(results)}/{len(results)} players to database in one transaction.")
+        return results
+
+
+player_writer = PlayerWriter()
+
+
 def create_player(user_id: int, username: str, village: str) -> Optional[Player]:
     """
     Creates a new player entry in the database (Synchronous).
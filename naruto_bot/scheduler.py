@@ -8,6 +8,7 @@ from apscheduler.triggers.interval import IntervalTrigger
 from .config import config
 from .database import get_db_connection
 from .cache import cache_manager
+from .models import peek_player, player_writer
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +26,25 @@ async def regenerate_resources():
             players = cursor.fetchall()
             
             update_data = []
+            cached_count = 0
             for player in players:
                 user_id = player['user_id']
                 
                 # FIX: Added await
                 if await cache_manager.is_in_battle(user_id):
                     continue
+
+                # A player held in process memory may have newer unsaved state, and its next
+                # full-row save would undo a direct UPDATE; regenerate it there and save via the writer
+                cached = peek_player(user_id)
+                if cached is not None:
+                    old = (cached.current_hp, cached.current_chakra)
+                    cached.restore_hp(int(cached.max_hp * 0.05))
+                    cached.restore_chakra(int(cached.max_chakra * 0.10))
+                    if (cached.current_hp, cached.current_chakra) != old:
+                        player_writer.enqueue(cached)
+                        cached_count += 1
+                    continue
                     
                 hp_regen = int(player['max_hp'] * 0.05)
                 chakra_regen = int(player['max_chakra'] * 0.10)
@@ -48,6 +62,8 @@ async def regenerate_resources():
                 )
                 conn.commit()
                 logger.info(f"[Scheduler] Regenerated resources for {len(update_data)} players.")
+            if cached_count:
+                logger.info(f"[Scheduler] Regenerated resources for {cached_count} in-memory players via the writer.")
             
             # FIX: Added await
             for _, _, user_id in update_data:
@@ -1,7 +1,9 @@
 # naruto_bot/services.py
 import logging
+import asyncio
+import time
 from .config import config
-from .game_data import JUTSU_LIBRARY, HAND_SIGNS
+from .game_data import JUTSU_LIBRARY, JUTSU_NAME_INDEX, HAND_SIGNS_SET, match_signs
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,74 @@ async def safe_animation(message, animation_func, fallback_text: str):
         except Exception as e2:
             logger.error(f"Failed to even edit to fallback text! Error: {e2}")
 
+# --- Message Edit Throttling ---
+# Telegram allows roughly one edit per second per message. Edits that arrive faster
+# are coalesced: only the latest pending text is sent once the interval has passed.
+
+_edit_state: dict[tuple[int, int], dict] = {}
+
+def _prune_edit_state(now: float):
+    """Drops idle entries so the table doesn't grow with every message ever animated."""
+    for key in [k for k, st in _edit_state.items()
+                if st['task'] is None and now - st['last_ts'] > config.EDIT_MIN_INTERVAL]:
+        del _edit_state[key]
+
+def _edit_state_for(key: tuple[int, int], now: float) -> dict:
+    """Returns (creating if needed) the throttle state for a (chat_id, message_id)."""
+    state = _edit_state.get(key)
+    if state is None:
+        if len(_edit_state) > 1024:
+            _prune_edit_state(now)
+        state = _edit_state[key] = {'last_ts': 0.0, 'last_text': None, 'task': None, 'pending': None}
+    return state
+
+async def _flush_pending_edit(bot, key: tuple[int, int], delay: float):
+    """Sends the latest coalesced text for a message once its interval has elapsed."""
+    await asyncio.sleep(delay)
+    state = _edit_state[key]
+    text, parse_mode = state['pending']
+    state['task'] = None
+    state['last_ts'] = time.monotonic()
+    if text == state['last_text']:
+        return
+    try:
+        await bot.edit_message_text(chat_id=key[0], message_id=key[1], text=text, parse_mode=parse_mode)
+        state['last_text'] = text
+    except Exception as e:
+        logger.warning(f"Deferred edit of message {key[1]} failed: {e}")
+
+def note_message_text(chat_id: int, message_id: int, text: str):
+    """
+    Records text that was sent or edited outside throttled_edit, so a following
+    identical frame is skipped and the edit interval counts from now.
+    """
+    now = time.monotonic()
+    state = _edit_state_for((chat_id, message_id), now)
+    state['last_ts'] = now
+    state['last_text'] = text
+
+async def throttled_edit(bot, chat_id: int, message_id: int, text: str, parse_mode=None):
+    """
+    Edits a message, respecting config.EDIT_MIN_INTERVAL per message.
+    Too-early edits are deferred and coalesced (last text wins); immediate edits raise as usual.
+    """
+    key = (chat_id, message_id)
+    now = time.monotonic()
+    state = _edit_state_for(key, now)
+
+    wait = state['last_ts'] + config.EDIT_MIN_INTERVAL - now
+    if wait > 0 or state['task'] is not None:
+        state['pending'] = (text, parse_mode)
+        if state['task'] is None:
+            state['task'] = asyncio.create_task(_flush_pending_edit(bot, key, max(wait, 0.0)))
+        return
+
+    if text == state['last_text']:
+        return # Telegram rejects no-op edits; skip the round trip entirely
+    state['last_ts'] = now
+    await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, parse_mode=parse_mode)
+    state['last_text'] = text
+
 # --- Jutsu Service Functions ---
 
 def get_jutsu_by_name(jutsu_name: str) -> tuple[str, dict] | None:  # FIX: Returns tuple
@@ -42,35 +112,26 @@ def get_jutsu_by_name(jutsu_name: str) -> tuple[str, dict] | None:  # FIX: Retur
     Finds a jutsu in the JUTSU_LIBRARY by its name or key.
     Returns (jutsu_key, jutsu_dict) tuple or None.
     """
-    jutsu_name = jutsu_name.lower().strip()
-    
-    # Check if it's a direct key match
-    if jutsu_name in JUTSU_LIBRARY:
-        return jutsu_name, JUTSU_LIBRARY[jutsu_name]
-    
-    # Allow searching by full name
-    for key, jutsu in JUTSU_LIBRARY.items():
-        if jutsu['name'].lower() == jutsu_name:
-            return key, jutsu
-            
-    return None
+    key = JUTSU_NAME_INDEX.get(jutsu_name.lower().strip())
+    if key is None:
+        return None
+    return key, JUTSU_LIBRARY[key]
 
 def get_jutsu_by_signs(signs: list[str]) -> tuple[str, dict] | None:
     """
     Finds a jutsu in the JUTSU_LIBRARY by its hand sign combination.
     Returns (jutsu_key, jutsu_dict).
     """
-    combo_str = ' '.join(signs)
-    for key, jutsu in JUTSU_LIBRARY.items():
-        if ' '.join(jutsu['signs']) == combo_str:
-            return key, jutsu
-    return None
+    key = match_signs(signs)
+    if key is None:
+        return None
+    return key, JUTSU_LIBRARY[key]
 
-def get_hand_signs_for_jutsu(jutsu_key: str) -> list[str]:
+def get_hand_signs_for_jutsu(jutsu_key: str) -> tuple[str, ...]:
     """Gets the hand signs for a given jutsu key."""
     jutsu = JUTSU_LIBRARY.get(jutsu_key)
-    return jutsu['signs'] if jutsu else []
+    return jutsu['signs'] if jutsu else ()
 
 def validate_hand_signs(signs: list[str]) -> bool:
     """Checks if all provided signs are valid."""
-    return all(sign in HAND_SIGNS for sign in signs)
+    return all(sign in HAND_SIGNS_SET for sign in signs)